@@ -1,97 +1,485 @@
 
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, g, has_app_context, request, jsonify
 from flask_cors import CORS
 import sqlite3
 import jwt
 import datetime
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
 import json
+import hashlib
+import atexit
+import base64
+import threading
+import uuid
+from functools import wraps
+from werkzeug.local import LocalProxy
+from database import ConnectionPool, DATABASE
+from cache import LRUCache, ReadThroughCache
+from delta import diff
+from broker import GameBroker
+from hashing import PasswordHasher, HasherBusy
+from engine import GameEngine, GameNotLive
+from archive import Archiver, GameArchive
+from models import Event, GameState
+from metrics import Metrics
+from revocation import TokenDenylist
+from ratelimit import RateLimiter, parse_limits, retry_after
+import codec
+import migrations
+import stats
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+api = Blueprint('api', __name__)
 
-# Secret key for JWT
-SECRET_KEY = "your-secret-key"  # Should be a real secret in production
+# Settings of an app, read from the environment. Values passed to
+# create_app() take precedence.
+def config_from_env():
+    return {
+        'DATABASE': os.environ.get('DATABASE', DATABASE),
+        'SECRET_KEY': os.environ.get('SECRET_KEY', 'your-secret-key'),  # Should be a real secret in production
+        'DB_POOL_SIZE': int(os.environ.get('DB_POOL_SIZE', 8)),
+        'METRICS_SAMPLE_RATE': float(os.environ.get('METRICS_SAMPLE_RATE', 1.0)),
+        'STREAM_QUEUE_SIZE': int(os.environ.get('STREAM_QUEUE_SIZE', 256)),
+        'GAME_FLUSH_INTERVAL': float(os.environ.get('GAME_FLUSH_INTERVAL', 1.0)),
+        'GAME_IDLE_TIMEOUT': float(os.environ.get('GAME_IDLE_TIMEOUT', 300)),
+        'PASSWORD_HASH_METHOD': os.environ.get('PASSWORD_HASH_METHOD') or None,
+        'HASH_WORKERS': int(os.environ['HASH_WORKERS']) if 'HASH_WORKERS' in os.environ else None,
+        'HASH_QUEUE_SIZE': int(os.environ.get('HASH_QUEUE_SIZE', 0)) or None,
+        'PRINCIPAL_CACHE_SIZE': int(os.environ.get('PRINCIPAL_CACHE_SIZE', 10000)),
+        'PRINCIPAL_CACHE_TTL': float(os.environ.get('PRINCIPAL_CACHE_TTL', 300)),
+        'TOKEN_CACHE_SIZE': int(os.environ.get('TOKEN_CACHE_SIZE', 10000)),
+        'GAME_VIEW_CACHE_SIZE': int(os.environ.get('GAME_VIEW_CACHE_SIZE', 10000)),
+        'GAME_VIEW_TTL': float(os.environ.get('GAME_VIEW_TTL', 2)),
+        'RATE_LIMITING': os.environ.get('RATE_LIMITING', '1') != '0',
+        'RATE_LIMITS': os.environ.get('RATE_LIMITS', ''),
+        'RATE_LIMIT_MAX_KEYS': int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100000)),
+        'ARCHIVE_DATABASE': os.environ.get('ARCHIVE_DATABASE'),
+        'ARCHIVE_AFTER': float(os.environ.get('ARCHIVE_AFTER', 7 * 86400)),
+        'ARCHIVE_INTERVAL': float(os.environ.get('ARCHIVE_INTERVAL', 3600)),
+        'ARCHIVE_BATCH_SIZE': int(os.environ.get('ARCHIVE_BATCH_SIZE', 100)),
+        'VACUUM_PAGES': int(os.environ.get('VACUUM_PAGES', 1000)),
+        'GAME_DATA_CODEC': os.environ.get('GAME_DATA_CODEC', 'text'),
+        'COMPLETED_GAME_DATA_CODEC': os.environ.get('COMPLETED_GAME_DATA_CODEC', 'json+zlib'),
+        'SNAPSHOT_INTERVAL': int(os.environ.get('SNAPSHOT_INTERVAL', 50)),
+        'DELTA_HISTORY': int(os.environ.get('DELTA_HISTORY', 100)),
+        'MAX_CONFLICT_RETRIES': int(os.environ.get('MAX_CONFLICT_RETRIES', 3)),
+        'STREAM_HEARTBEAT': float(os.environ.get('STREAM_HEARTBEAT', 15)),
+        'MAX_BATCH_ACTIONS': int(os.environ.get('MAX_BATCH_ACTIONS', 20)),
+    }
+
+# Per-app resources (connection pool, game engine, caches, ...) live in
+# app.extensions['entanglion'] and are reached through these proxies, so
+# several apps (e.g. one per test) can share the process.
+def app_service(name):
+    return LocalProxy(lambda: getattr(current_app.extensions['entanglion'], name))
 
-# Create database connection
+db_pool = app_service('db_pool')
+metrics = app_service('metrics')
+broker = app_service('broker')
+game_engine = app_service('game_engine')
+password_hasher = app_service('password_hasher')
+principal_cache = app_service('principal_cache')
+token_cache = app_service('token_cache')
+token_denylist = app_service('token_denylist')
+game_views = app_service('game_views')
+rate_limiter = app_service('rate_limiter')
+game_archive = app_service('archive')
+conflict_stats = app_service('conflict_stats')
+
+# Get a database connection from the pool; close() returns it to the pool.
+# Connections are also registered with the app context, and any left open
+# when it ends (a handler that raised, e.g. PoolTimeout or "database is
+# locked") are rolled back and returned by release_db_connections().
 def get_db_connection():
-    conn = sqlite3.connect('database.db')
-    conn.row_factory = sqlite3.Row
+    return track_connection(db_pool.connection())
+
+def track_connection(conn):
+    connections = g.setdefault('db_connections', [])
+    connections[:] = [c for c in connections if not c.closed]
+    connections.append(conn)
     return conn
 
-# Initialize database
+def release_db_connections(exc=None):
+    for conn in g.pop('db_connections', ()):
+        conn.close()
+
+# Create or upgrade the schema by applying the pending migrations
 def init_db():
     conn = get_db_connection()
+    migrations.migrate(conn)
+    conn.close()
+
+# Codecs for the games.data column (GAME_DATA_CODEC and
+# COMPLETED_GAME_DATA_CODEC): games in play are read and written all the
+# time, completed games mostly sit on disk
+def encode_state(game_data, status=None):
+    name = current_app.config['COMPLETED_GAME_DATA_CODEC' if status == 'completed' else 'GAME_DATA_CODEC']
+    value = codec.encode(game_data, name)
+    metrics.observe_game_data(value, name)
+    return value
+
+def decode_state(raw):
+    return codec.decode(raw)
+
+# Append events to a game's log. Each event gets the next sequence number
+# for its game, which is also set on the event dicts; callers commit as part
+# of their own transaction.
+def append_events(conn, game_id, events):
+    if not events:
+        return events
+    
+    seq = conn.execute('''
+        SELECT COALESCE(MAX(seq), 0) AS seq FROM game_events WHERE game_id = ?
+    ''', (game_id,)).fetchone()['seq']
+    
+    for event in events:
+        seq += 1
+        event['seq'] = seq
+    
+    insert_events(conn, game_id, events)
+    return events
+
+# Insert events that already carry their seq, and count them into the
+# players' statistics in the same transaction
+def insert_events(conn, game_id, events):
+    for event in events:
+        data = dict(event)
+        seq = data.pop('seq')
+        conn.execute('''
+            INSERT INTO game_events (game_id, seq, type, data)
+            VALUES (?, ?, ?, ?)
+        ''', (game_id, seq, event['type'], json.dumps(data)))
+    
+    stats.record_events(conn, game_id, events)
+
+# A snapshot of the full state is stored at least every SNAPSHOT_INTERVAL
+# events (see GameEngine.snapshot_due), so a replay applies at most about
+# that many events. Store game_data as the state after event seq; callers
+# commit
+def record_snapshot(conn, game_id, seq, game_data):
     conn.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        email TEXT NOT NULL UNIQUE,
-        password_hash TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Create games table
-    conn.execute('''
-    CREATE TABLE IF NOT EXISTS games (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        status TEXT NOT NULL,
-        created_by INTEGER NOT NULL,
-        data TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (created_by) REFERENCES users (id)
-    )
-    ''')
-    
-    # Create user_games junction table
-    conn.execute('''
-    CREATE TABLE IF NOT EXISTS user_games (
-        user_id INTEGER NOT NULL,
-        game_id INTEGER NOT NULL,
-        role TEXT NOT NULL,
-        joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        PRIMARY KEY (user_id, game_id),
-        FOREIGN KEY (user_id) REFERENCES users (id),
-        FOREIGN KEY (game_id) REFERENCES games (id)
-    )
-    ''')
+        INSERT OR REPLACE INTO game_snapshots (game_id, seq, data)
+        VALUES (?, ?, ?)
+    ''', (game_id, seq, encode_state(game_data, game_data.get('status'))))
+
+class VersionConflict(Exception):
+    pass
+
+# Write a new game state if the stored version is still expected_version
+# (compare-and-swap), bump the version and record the patch from the
+# previous state. Returns (version, patch); callers commit. On a conflict
+# the connection is closed, rolling back the transaction, and
+# VersionConflict is raised so the whole operation can be retried.
+def save_game_state(conn, game_id, previous_data, game_data, expected_version, status=None):
+    patch = diff(decode_state(previous_data), game_data)
+    
+    cursor = conn.execute('''
+        UPDATE games
+        SET data = ?, status = COALESCE(?, status), version = version + 1,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND version = ?
+    ''', (encode_state(game_data, status), status, game_id, expected_version))
+    
+    if cursor.rowcount != 1:
+        conn.close()
+        raise VersionConflict(game_id)
+    
+    version = expected_version + 1
+    record_deltas(conn, game_id, [(version, patch)])
+    
+    return version, patch
+
+# Store state patches and drop the ones older than DELTA_HISTORY versions,
+# the number of past versions per game kept for ?since_version= requests
+def record_deltas(conn, game_id, deltas):
+    for version, patch in deltas:
+        conn.execute('''
+            INSERT OR REPLACE INTO game_deltas (game_id, version, patch)
+            VALUES (?, ?, ?)
+        ''', (game_id, version, json.dumps(patch)))
+    
+    if deltas:
+        conn.execute('''
+            DELETE FROM game_deltas
+            WHERE game_id = ? AND version <= ?
+        ''', (game_id, deltas[-1][0] - current_app.config['DELTA_HISTORY']))
+
+# Optimistic concurrency: handlers that call save_game_state are re-run from
+# scratch, up to MAX_CONFLICT_RETRIES times, when another request committed
+# a newer version first.
+def retry_on_conflict(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        retries = current_app.config['MAX_CONFLICT_RETRIES']
+        for attempt in range(retries + 1):
+            try:
+                return f(*args, **kwargs)
+            except VersionConflict:
+                conflict_stats.record(retried=attempt < retries)
+        
+        return jsonify({'error': 'Game was updated concurrently, please retry'}), 409
+    
+    return decorated
+
+# Counts of version conflicts, and of those that were retried or gave up
+class ConflictStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.conflicts = 0
+        self.retries = 0
+        self.exhausted = 0
+    
+    def record(self, retried):
+        with self._lock:
+            self.conflicts += 1
+            if retried:
+                self.retries += 1
+            else:
+                self.exhausted += 1
+    
+    def stats(self):
+        with self._lock:
+            return {'conflicts': self.conflicts, 'retries': self.retries, 'exhausted': self.exhausted}
+
+def game_etag(game_id, version):
+    return '%d-%d' % (game_id, version)
+
+# Opaque keyset cursor for the game listing
+def encode_cursor(updated_at, game_id):
+    raw = json.dumps([updated_at, game_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        updated_at, game_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(updated_at, str) or not isinstance(game_id, int):
+        raise ValueError('Invalid cursor')
+    return updated_at, game_id
+
+def wants_delta():
+    return request.args.get('delta') in ('1', 'true')
+
+# Push committed events and the state delta to a game's subscribers, and
+# drop the cached view of the game. Must only be called after the
+# transaction has been committed.
+def publish_game_update(game_id, events, version, patch, status=None):
+    game_views.invalidate(game_id)
+    for event in events:
+        broker.publish(game_id, {'event': 'game_event', 'id': event['seq'], 'data': event})
+    broker.publish(game_id, {
+        'event': 'delta',
+        'data': {'version': version, 'status': status, 'patch': patch}
+    })
+
+# Load a game in progress for the in-memory engine
+def load_live_game(game_id):
+    conn = get_db_connection()
+    game = conn.execute('''
+        SELECT g.*, u.name as creator_name
+        FROM games g
+        JOIN users u ON g.created_by = u.id
+        WHERE g.id = ? AND g.status = 'in_progress'
+    ''', (game_id,)).fetchone()
+    
+    if not game:
+        conn.close()
+        return None
+    
+    seq = conn.execute('''
+        SELECT COALESCE(MAX(seq), 0) AS seq FROM game_events WHERE game_id = ?
+    ''', (game_id,)).fetchone()['seq']
+    
+    deltas = conn.execute('''
+        SELECT version, patch
+        FROM game_deltas
+        WHERE game_id = ?
+        ORDER BY version
+    ''', (game_id,)).fetchall()
+    conn.close()
+    
+    return {
+        'state': decode_state(game['data']),
+        'version': game['version'],
+        'next_seq': seq + 1,
+        'deltas': [(delta['version'], json.loads(delta['patch'])) for delta in deltas],
+        'meta': {
+            'name': game['name'],
+            'creator_name': game['creator_name'],
+            'created_at': game['created_at'],
+            'updated_at': game['updated_at']
+        }
+    }
+
+# Write-behind target of the engine: store the latest state, the patches and
+# events accumulated since the last flush, in one transaction. Returns False
+# if the stored version is not the one the engine last persisted.
+def persist_live_game(game_id, snapshot):
+    conn = get_db_connection()
+    cursor = conn.execute('''
+        UPDATE games
+        SET data = ?, status = ?, version = ?, updated_at = ?
+        WHERE id = ? AND version = ?
+    ''', (encode_state(snapshot['state'], snapshot['status']), snapshot['status'],
+          snapshot['version'], snapshot['updated_at'],
+          game_id, snapshot['base_version']))
+    
+    if cursor.rowcount != 1:
+        conn.close()
+        return False
+    
+    record_deltas(conn, game_id, snapshot['deltas'])
+    insert_events(conn, game_id, snapshot['events'])
+    for seq, state in snapshot['snapshots']:
+        record_snapshot(conn, game_id, seq, state)
     
     conn.commit()
     conn.close()
+    return True
+
+# Error response for a move on a game that is not live in the engine
+def game_not_playable(current_user, game_id):
+    conn = get_db_connection()
+    user_game = conn.execute('''
+        SELECT g.status
+        FROM user_games ug
+        JOIN games g ON ug.game_id = g.id
+        WHERE ug.user_id = ? AND ug.game_id = ?
+    ''', (current_user['id'], game_id)).fetchone()
+    conn.close()
+    
+    if not user_game:
+        return jsonify({'error': 'Game not found or you are not part of it'}), 404
+    
+    return jsonify({'error': 'Game is not in progress'}), 409
 
-# Initialize the database on startup
-init_db()
+def format_sse(event, data, event_id=None):
+    message = 'event: %s\n' % event
+    if event_id is not None:
+        message += 'id: %s\n' % event_id
+    return message + 'data: %s\n\n' % json.dumps(data)
 
-# Authentication middleware
-def token_required(f):
+def hasher_busy_response():
+    response = jsonify({'error': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def rate_limited_response(wait):
+    response = jsonify({'error': 'Too many requests, please slow down'})
+    response.headers['Retry-After'] = retry_after(wait)
+    return response, 429
+
+# Rate limit a route that has no user yet by client address, before it
+# reads the database or hashes a password
+def limit_by_address(f):
+    @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
+        wait = rate_limiter.acquire(f.__name__, request.remote_addr)
+        if wait:
+            return rate_limited_response(wait)
         
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            if auth_header.startswith('Bearer '):
-                token = auth_header[7:]
+        return f(*args, **kwargs)
+    
+    return decorated
+
+# Principal fields (id, name) of authenticated users are cached by user id.
+# Anything that changes or deletes a user must call invalidate_principal().
+def load_principal(user_id):
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+    
+    conn = get_db_connection()
+    user = conn.execute('SELECT id, name FROM users WHERE id = ?', (user_id,)).fetchone()
+    conn.close()
+    
+    if not user:
+        return None
+    
+    principal = {'id': user['id'], 'name': user['name']}
+    principal_cache.set(user_id, principal)
+    return principal
+
+def invalidate_principal(user_id):
+    principal_cache.invalidate(user_id)
+
+# Verified claims are cached by a digest of the raw token. Each entry expires
+# at the token's own 'exp', so an expired token always goes back through
+# jwt.decode and fails there.
+def token_digest(token):
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+def decode_token(token):
+    key = token_digest(token)
+    claims = token_cache.get(key)
+    if claims is not None:
+        return claims
+    
+    claims = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+    
+    # Tokens issued before jti existed are revoked by their digest
+    if 'jti' not in claims:
+        claims['jti'] = key.hex()
+    
+    # Only tokens that carry an expiry are cached
+    if 'exp' in claims:
+        token_cache.set(key, claims, expires_at=claims['exp'])
+    return claims
+
+def invalidate_token(token):
+    token_cache.invalidate(token_digest(token))
+
+# Tokens are valid for a day unless revoked (POST /api/logout)
+def issue_token(user_id):
+    return jwt.encode({
+        'user_id': user_id,
+        'jti': uuid.uuid4().hex,
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(days=1)
+    }, current_app.config['SECRET_KEY'], algorithm='HS256')
+
+def revoke_token(token, claims):
+    token_denylist.revoke(claims['jti'], claims.get('exp'))
+    invalidate_token(token)
+
+# Resolve the user of an Authorization header, counting the request against
+# the user's rate limit for route. Returns (current_user, None) or (None,
+# error response).
+def authenticate(auth_header, route):
+    token = None
+    
+    if auth_header and auth_header.startswith('Bearer '):
+        token = auth_header[7:]
+    
+    if not token:
+        return None, (jsonify({'error': 'Token is missing!'}), 401)
+    
+    try:
+        data = decode_token(token)
+        if token_denylist.is_revoked(data['jti'], data.get('exp')):
+            return None, (jsonify({'error': 'Token has been revoked!'}), 401)
         
-        if not token:
-            return jsonify({'error': 'Token is missing!'}), 401
+        wait = rate_limiter.acquire(route, data['user_id'])
+        if wait:
+            return None, rate_limited_response(wait)
         
-        try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-            conn = get_db_connection()
-            current_user = conn.execute('SELECT * FROM users WHERE id = ?', (data['user_id'],)).fetchone()
-            conn.close()
-            
-            if not current_user:
-                return jsonify({'error': 'User not found!'}), 401
-            
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired!'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token!'}), 401
+        current_user = load_principal(data['user_id'])
+        
+        if not current_user:
+            return None, (jsonify({'error': 'User not found!'}), 401)
+        
+    except jwt.ExpiredSignatureError:
+        return None, (jsonify({'error': 'Token has expired!'}), 401)
+    except jwt.InvalidTokenError:
+        return None, (jsonify({'error': 'Invalid token!'}), 401)
+    
+    return current_user, None
+
+# Authentication middleware
+def token_required(f):
+    def decorated(*args, **kwargs):
+        current_user, error = authenticate(request.headers.get('Authorization'), f.__name__)
+        if error:
+            return error
         
         return f(current_user, *args, **kwargs)
     
@@ -99,7 +487,8 @@ def token_required(f):
     return decorated
 
 # Authentication routes
-@app.route('/api/register', methods=['POST'])
+@api.route('/api/register', methods=['POST'])
+@limit_by_address
 def register():
     data = request.get_json()
     
@@ -113,14 +502,19 @@ def register():
     
     # Check if user already exists
     conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
+    user = conn.execute('SELECT id FROM users WHERE email = ?', (email,)).fetchone()
+    conn.close()
     
     if user:
-        conn.close()
         return jsonify({'error': 'User already exists'}), 409
     
     # Create new user
-    password_hash = generate_password_hash(password)
+    try:
+        password_hash = password_hasher.hash(password)
+    except HasherBusy:
+        return hasher_busy_response()
+    
+    conn = get_db_connection()
     
     try:
         conn.execute('INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)',
@@ -128,10 +522,7 @@ def register():
         conn.commit()
         
         # Generate JWT token
-        token = jwt.encode({
-            'user_id': conn.execute('SELECT id FROM users WHERE email = ?', (email,)).fetchone()['id'],
-            'exp': datetime.datetime.utcnow() + datetime.timedelta(days=1)
-        }, SECRET_KEY, algorithm='HS256')
+        token = issue_token(conn.execute('SELECT id FROM users WHERE email = ?', (email,)).fetchone()['id'])
         
         conn.close()
         
@@ -144,11 +535,16 @@ def register():
             'message': 'User registered successfully'
         }), 201
         
+    except sqlite3.IntegrityError:
+        # Registered concurrently while the password was being hashed
+        conn.close()
+        return jsonify({'error': 'User already exists'}), 409
     except Exception as e:
         conn.close()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
+@limit_by_address
 def login():
     data = request.get_json()
     
@@ -162,18 +558,30 @@ def login():
     # Check if user exists
     conn = get_db_connection()
     user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
+    conn.close()
     
-    if not user or not check_password_hash(user['password_hash'], password):
-        conn.close()
+    if not user:
         return jsonify({'error': 'Invalid credentials'}), 401
     
-    # Generate JWT token
-    token = jwt.encode({
-        'user_id': user['id'],
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(days=1)
-    }, SECRET_KEY, algorithm='HS256')
+    try:
+        if not password_hasher.verify(user['password_hash'], password):
+            return jsonify({'error': 'Invalid credentials'}), 401
+    except HasherBusy:
+        return hasher_busy_response()
     
-    conn.close()
+    # Upgrade hashes made with an outdated method or cost
+    try:
+        if password_hasher.needs_rehash(user['password_hash']):
+            password_hash = password_hasher.rehash(password)
+            conn = get_db_connection()
+            conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user['id']))
+            conn.commit()
+            conn.close()
+    except HasherBusy:
+        pass  # Try again on a later login
+    
+    # Generate JWT token
+    token = issue_token(user['id'])
     
     return jsonify({
         'token': token,
@@ -184,7 +592,19 @@ def login():
         'message': 'Login successful'
     }), 200
 
-@app.route('/api/user', methods=['GET'])
+@api.route('/api/logout', methods=['POST'])
+def logout():
+    current_user, error = authenticate(request.headers.get('Authorization'), 'logout')
+    if error:
+        return error
+    
+    # authenticate() accepted the header, so it is a valid bearer token
+    token = request.headers['Authorization'][7:]
+    revoke_token(token, decode_token(token))
+    
+    return jsonify({'message': 'Logged out successfully'}), 200
+
+@api.route('/api/user', methods=['GET'])
 def get_user():
     token = request.headers.get('Authorization')
     if not token:
@@ -195,7 +615,10 @@ def get_user():
         if token.startswith('Bearer '):
             token = token[7:]
             
-        data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        data = decode_token(token)
+        if token_denylist.is_revoked(data['jti'], data.get('exp')):
+            return jsonify({'error': 'Token has been revoked'}), 401
+        
         user_id = data['user_id']
         
         conn = get_db_connection()
@@ -219,23 +642,139 @@ def get_user():
     except jwt.InvalidTokenError:
         return jsonify({'error': 'Invalid token'}), 401
 
+# Profile routes
+def user_stats(conn, user_id):
+    row = conn.execute('''
+        SELECT %s FROM user_stats WHERE user_id = ?
+    ''' % ', '.join(stats.STATS), (user_id,)).fetchone()
+    return dict(row) if row else stats.empty_stats()
+
+@api.route('/api/profile', methods=['GET'])
+@token_required
+def get_profile(current_user):
+    conn = get_db_connection()
+    user = conn.execute('SELECT id, name, email, created_at FROM users WHERE id = ?', (current_user['id'],)).fetchone()
+    player_stats = user_stats(conn, current_user['id'])
+    achievements = conn.execute('''
+        SELECT COUNT(*) AS count FROM user_achievements WHERE user_id = ?
+    ''', (current_user['id'],)).fetchone()['count']
+    conn.close()
+    
+    return jsonify({
+        'profile': {
+            'id': user['id'],
+            'name': user['name'],
+            'email': user['email'],
+            'created_at': user['created_at'],
+            'stats': player_stats,
+            'achievements_unlocked': achievements
+        }
+    }), 200
+
+@api.route('/api/achievements', methods=['GET'])
+@token_required
+def get_achievements(current_user):
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT a.id, a.name, a.description, a.stat, a.threshold, ua.unlocked_at
+        FROM achievements a
+        LEFT JOIN user_achievements ua ON ua.achievement_id = a.id AND ua.user_id = ?
+        ORDER BY a.id
+    ''', (current_user['id'],)).fetchall()
+    player_stats = user_stats(conn, current_user['id'])
+    conn.close()
+    
+    return jsonify({
+        'achievements': [
+            {
+                'id': row['id'],
+                'name': row['name'],
+                'description': row['description'],
+                'unlocked': row['unlocked_at'] is not None,
+                'unlocked_at': row['unlocked_at'],
+                'progress': min(player_stats.get(row['stat'], 0), row['threshold']),
+                'threshold': row['threshold']
+            } for row in rows
+        ]
+    }), 200
+
+@api.route('/api/leaderboard', methods=['GET'])
+@token_required
+def get_leaderboard(current_user):
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    
+    # Reads idx_user_stats_leaderboard in order and stops at limit, no sort
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT s.user_id, u.name, s.games_won, s.particles_collected, s.games_played
+        FROM user_stats s
+        JOIN users u ON u.id = s.user_id
+        ORDER BY s.games_won DESC, s.particles_collected DESC, s.user_id
+        LIMIT ?
+    ''', (limit,)).fetchall()
+    conn.close()
+    
+    return jsonify({
+        'leaderboard': [
+            {
+                'rank': rank,
+                'user_id': row['user_id'],
+                'name': row['name'],
+                'games_won': row['games_won'],
+                'particles_collected': row['particles_collected'],
+                'games_played': row['games_played']
+            } for rank, row in enumerate(rows, 1)
+        ]
+    }), 200
+
 # Game routes
-@app.route('/api/games', methods=['GET'])
+@api.route('/api/games', methods=['GET'])
 @token_required
 def get_games(current_user):
-    conn = get_db_connection()
+    status = request.args.get('status')
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
     
-    # Get all games the user is a part of
-    games_data = conn.execute('''
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            cursor_updated_at, cursor_id = decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    # Games the user is part of, newest first. Keyset pagination on the
+    # game's (updated_at, id), which user_games holds a copy of: the user's
+    # memberships are read from idx_user_games_recent already in that order,
+    # starting at the cursor, and games are looked up by primary key, so a
+    # page costs the same however deep it is. With a status filter the
+    # memberships of games in other states are skipped along the way.
+    # CROSS JOIN pins the join order.
+    query = '''
         SELECT g.id, g.name, g.status, g.created_at, g.updated_at, u.name as creator_name, ug.role
-        FROM games g
-        JOIN user_games ug ON g.id = ug.game_id
+        FROM user_games ug
+        CROSS JOIN games g ON g.id = ug.game_id
         JOIN users u ON g.created_by = u.id
         WHERE ug.user_id = ?
-    ''', (current_user['id'],)).fetchall()
+    '''
+    params = [current_user['id']]
+    
+    if status:
+        query += ' AND g.status = ?'
+        params.append(status)
     
+    if cursor:
+        query += ' AND (ug.game_updated_at, ug.game_id) < (?, ?)'
+        params.extend([cursor_updated_at, cursor_id])
+    
+    query += ' ORDER BY ug.game_updated_at DESC, ug.game_id DESC LIMIT ?'
+    params.append(limit + 1)
+    
+    conn = get_db_connection()
+    games_data = conn.execute(query, params).fetchall()
     conn.close()
     
+    has_more = len(games_data) > limit
+    games_data = games_data[:limit]
+    
     games = []
     for game in games_data:
         games.append({
@@ -248,9 +787,14 @@ def get_games(current_user):
             'updated_at': game['updated_at']
         })
     
-    return jsonify({'games': games}), 200
+    next_cursor = None
+    if has_more:
+        last = games_data[-1]
+        next_cursor = encode_cursor(last['updated_at'], last['id'])
+    
+    return jsonify({'games': games, 'next_cursor': next_cursor}), 200
 
-@app.route('/api/games', methods=['POST'])
+@api.route('/api/games', methods=['POST'])
 @token_required
 def create_game(current_user):
     data = request.get_json()
@@ -261,6 +805,9 @@ def create_game(current_user):
     game_name = data.get('name')
     player_count = data.get('player_count', 2)
     
+    if not isinstance(player_count, int) or not 2 <= player_count <= len(ROLES):
+        return jsonify({'error': 'player_count must be between 2 and %d' % len(ROLES)}), 400
+    
     # Initialize game data with default state
     game_data = {
         'board': 'quantum_realm',
@@ -280,8 +827,7 @@ def create_game(current_user):
             {'id': 2, 'type': 'electron', 'position': 'sector_b'},
             {'id': 3, 'type': 'qubit', 'position': 'sector_c'},
             {'id': 4, 'type': 'entangled_pair', 'position': 'sector_d'}
-        ],
-        'events': []
+        ]
     }
     
     conn = get_db_connection()
@@ -289,12 +835,15 @@ def create_game(current_user):
     try:
         # Create new game
         cursor = conn.execute('''
-            INSERT INTO games (name, status, created_by, data)
-            VALUES (?, ?, ?, ?)
-        ''', (game_name, 'waiting', current_user['id'], json.dumps(game_data)))
+            INSERT INTO games (name, status, created_by, data, seats_taken, max_players, roles_taken)
+            VALUES (?, ?, ?, ?, 1, ?, 1)
+        ''', (game_name, 'waiting', current_user['id'], encode_state(game_data), player_count))
         
         game_id = cursor.lastrowid
         
+        # Replays start from the initial state
+        record_snapshot(conn, game_id, 0, game_data)
+        
         # Add creator to the game
         conn.execute('''
             INSERT INTO user_games (user_id, game_id, role)
@@ -319,20 +868,72 @@ def create_game(current_user):
         conn.close()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/games/<int:game_id>', methods=['GET'])
+@api.route('/api/games/<int:game_id>', methods=['GET'])
 @token_required
 def get_game(current_user, game_id):
-    conn = get_db_connection()
+    view = game_views.peek(game_id)
     
-    # Check if user is part of the game
+    if view is None:
+        # Games in progress are served from the engine without touching SQLite
+        live = game_engine.get(game_id)
+        if live is not None:
+            return get_live_game(current_user, live)
+        
+        view = game_views.get(game_id)
+    
+    # Check if user is part of the game. The cached player list can lag a
+    # join made by another process, so a miss is confirmed in the database.
+    if view is None or current_user['id'] not in view['player_ids']:
+        if view is None or not is_player(current_user['id'], game_id):
+            return jsonify({'error': 'Game not found or you do not have access'}), 404
+        game_views.invalidate(game_id)
+        view = game_views.get(game_id)
+    
+    version = view['version']
+    etag = game_etag(game_id, version)
+    
+    # Conditional GET: nothing changed since the client's copy
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    
+    # Delta request: send the patches applied since the client's version
+    since_version = request.args.get('since_version', type=int)
+    if since_version is not None and 0 < since_version <= version:
+        conn = get_db_connection()
+        deltas = conn.execute('''
+            SELECT version, patch
+            FROM game_deltas
+            WHERE game_id = ? AND version > ? AND version <= ?
+            ORDER BY version
+        ''', (game_id, since_version, version)).fetchall()
+        conn.close()
+        
+        # Only usable if no version in between has been pruned
+        if len(deltas) == version - since_version:
+            patch = []
+            for delta in deltas:
+                patch.extend(json.loads(delta['patch']))
+            
+            return game_delta_response(game_id, view['status'], view['updated_at'],
+                                       since_version, version, patch)
+    
+    response = current_app.response_class(view['body'], mimetype='application/json')
+    response.set_etag(etag)
+    return response, 200
+
+def is_player(user_id, game_id):
+    conn = get_db_connection()
     user_game = conn.execute('''
-        SELECT * FROM user_games
+        SELECT 1 FROM user_games
         WHERE user_id = ? AND game_id = ?
-    ''', (current_user['id'], game_id)).fetchone()
-    
-    if not user_game:
-        conn.close()
-        return jsonify({'error': 'Game not found or you do not have access'}), 404
+    ''', (user_id, game_id)).fetchone()
+    conn.close()
+    return user_game is not None
+
+# Read-through loader of the game_views cache: a game as GET /api/games/<id>
+# returns it, already serialized, with its version and player ids
+def load_game_view(game_id):
+    conn = get_db_connection()
     
     # Get game details
     game = conn.execute('''
@@ -344,7 +945,7 @@ def get_game(current_user, game_id):
     
     if not game:
         conn.close()
-        return jsonify({'error': 'Game not found'}), 404
+        return None
     
     # Get all players in the game
     players = conn.execute('''
@@ -356,13 +957,14 @@ def get_game(current_user, game_id):
     
     conn.close()
     
-    game_data = json.loads(game['data'])
+    game_data = decode_state(load_game_data(game))
     
-    return jsonify({
+    body = current_app.json.dumps({
         'game': {
             'id': game['id'],
             'name': game['name'],
             'status': game['status'],
+            'version': game['version'],
             'creator_name': game['creator_name'],
             'created_at': game['created_at'],
             'updated_at': game['updated_at'],
@@ -375,10 +977,147 @@ def get_game(current_user, game_id):
                 } for player in players
             ]
         }
-    }), 200
+    }) + '\n'
+    
+    return {
+        'version': game['version'],
+        'status': game['status'],
+        'updated_at': game['updated_at'],
+        'player_ids': frozenset(player['id'] for player in players),
+        'body': body
+    }
+
+# Encoded state of a games row, from the archive if the game was archived
+def load_game_data(game):
+    if game['archived_at'] is not None:
+        return game_archive.load_data(game['id'])
+    return game['data']
+
+def not_modified(etag):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+def game_delta_response(game_id, status, updated_at, since_version, version, patch):
+    response = jsonify({
+        'game': {
+            'id': game_id,
+            'status': status,
+            'updated_at': updated_at,
+            'since_version': since_version,
+            'version': version,
+            'patch': patch
+        }
+    })
+    response.set_etag(game_etag(game_id, version))
+    return response, 200
 
-@app.route('/api/games/<int:game_id>/join', methods=['POST'])
+# get_game for a game held by the engine, answered from memory
+def get_live_game(current_user, live):
+    since_version = request.args.get('since_version', type=int)
+    
+    with live.lock:
+        # Check if user is part of the game
+        if live.state.player(current_user['id']) is None:
+            return jsonify({'error': 'Game not found or you do not have access'}), 404
+        
+        version = live.version
+        status = live.state.status
+        updated_at = live.updated_at
+        etag = game_etag(live.game_id, version)
+        
+        # Conditional GET: nothing changed since the client's copy
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+        
+        patch = None
+        if since_version is not None and 0 < since_version <= version:
+            patch = live.patch_since(since_version)
+        
+        game_data = live.snapshot() if patch is None else None
+    
+    if patch is not None:
+        return game_delta_response(live.game_id, status, updated_at, since_version, version, patch)
+    
+    response = jsonify({
+        'game': {
+            'id': live.game_id,
+            'name': live.meta['name'],
+            'status': status,
+            'version': version,
+            'creator_name': live.meta['creator_name'],
+            'created_at': live.meta['created_at'],
+            'updated_at': updated_at,
+            'data': game_data,
+            'players': [
+                {
+                    'id': player['id'],
+                    'name': player['name'],
+                    'role': player['role']
+                } for player in game_data['players']
+            ]
+        }
+    })
+    response.set_etag(etag)
+    return response, 200
+
+ROLES = migrations.ROLES
+
+# Open games tried by a quick join before giving up
+QUICKJOIN_CANDIDATES = 5
+
+# Take a seat and the first free role in an open game with one conditional
+# write on its seat counters. Returns the role, or None if the game changed
+# since it was read; callers commit.
+def claim_seat(conn, game):
+    roles = free_roles(game['roles_taken'])
+    role = roles[0] if roles else 'observer'  # Default if all roles are taken
+    role_bit = 1 << ROLES.index(role) if roles else 0
+    
+    cursor = conn.execute('''
+        UPDATE games
+        SET seats_taken = seats_taken + 1, roles_taken = roles_taken | ?
+        WHERE id = ? AND version = ? AND status IN ('waiting', 'ready') AND seats_taken < max_players
+    ''', (role_bit, game['id'], game['version']))
+    
+    return role if cursor.rowcount == 1 else None
+
+# Add the player who claimed a seat to the game state. Returns (version,
+# patch, events, game_data). Raises sqlite3.IntegrityError if they were
+# already in the game.
+def add_player(conn, game, current_user, role):
+    conn.execute('''
+        INSERT INTO user_games (user_id, game_id, role)
+        VALUES (?, ?, ?)
+    ''', (current_user['id'], game['id'], role))
+    
+    player = {
+        'id': current_user['id'],
+        'name': current_user['name'],
+        'role': role,
+        'position': 'start',
+        'collected_particles': []
+    }
+    game_data = decode_state(game['data'])
+    game_data['players'].append(player)
+    
+    # If game now has enough players, update status
+    status = None
+    if game['seats_taken'] + 1 >= 2:  # Minimum 2 players to start
+        status = game_data['status'] = 'ready'
+    version, patch = save_game_state(conn, game['id'], game['data'], game_data, game['version'], status=status)
+    
+    events = append_events(conn, game['id'], [
+        Event('player_joined', player=player, player_name=current_user['name'], status=status).to_dict()
+    ])
+    if game_engine.snapshot_due(events):
+        record_snapshot(conn, game['id'], events[-1]['seq'], game_data)
+    
+    return version, patch, events, game_data
+
+@api.route('/api/games/<int:game_id>/join', methods=['POST'])
 @token_required
+@retry_on_conflict
 def join_game(current_user, game_id):
     conn = get_db_connection()
     
@@ -389,92 +1128,118 @@ def join_game(current_user, game_id):
         conn.close()
         return jsonify({'error': 'Game not found'}), 404
     
-    # Check if user is already in the game
-    user_game = conn.execute('''
-        SELECT * FROM user_games
-        WHERE user_id = ? AND game_id = ?
-    ''', (current_user['id'], game_id)).fetchone()
-    
-    if user_game:
+    # Players can only join before the game starts
+    if game['status'] not in ('waiting', 'ready'):
         conn.close()
-        return jsonify({'error': 'You are already in this game'}), 409
+        return jsonify({'error': 'Game has already started'}), 409
     
-    # Check if game is full
-    player_count = conn.execute('''
-        SELECT COUNT(*) as count
-        FROM user_games
-        WHERE game_id = ?
-    ''', (game_id,)).fetchone()['count']
+    if game['seats_taken'] >= game['max_players']:
+        conn.close()
+        return jsonify({'error': 'Game is full'}), 409
     
-    game_data = json.loads(game['data'])
-    max_players = game_data.get('player_count', 4)
+    role = claim_seat(conn, game)
+    if role is None:
+        conn.close()
+        raise VersionConflict(game_id)
     
-    if player_count >= max_players:
+    try:
+        version, patch, events, game_data = add_player(conn, game, current_user, role)
+    except sqlite3.IntegrityError:
         conn.close()
-        return jsonify({'error': 'Game is full'}), 409
+        return jsonify({'error': 'You are already in this game'}), 409
     
-    # Determine role
-    roles = ['quantum_operator', 'navigation_engineer', 'particle_collector', 'quantum_physicist']
-    assigned_roles = conn.execute('''
-        SELECT role
-        FROM user_games
-        WHERE game_id = ?
-    ''', (game_id,)).fetchall()
+    conn.commit()
+    conn.close()
     
-    assigned_role_list = [role['role'] for role in assigned_roles]
-    available_roles = [role for role in roles if role not in assigned_role_list]
+    publish_game_update(game_id, events, version, patch, game_data.get('status'))
     
-    if not available_roles:
-        assigned_role = 'observer'  # Default if all roles are taken
-    else:
-        assigned_role = available_roles[0]
+    return jsonify({
+        'message': 'Successfully joined game',
+        'role': role,
+        'version': version,
+        'game_data': game_data
+    }), 200
+
+# Games that still have free seats, fullest first so games fill up and start
+# sooner. Without ANALYZE statistics SQLite prefers the status index and
+# sorts, so the partial index is named explicitly.
+def open_games(conn, user_id, limit):
+    return conn.execute('''
+        SELECT g.id, g.name, g.status, g.version, g.data, g.seats_taken, g.max_players,
+               g.roles_taken, g.created_at, u.name AS creator_name
+        FROM games g INDEXED BY idx_games_open
+        JOIN users u ON g.created_by = u.id
+        WHERE g.status IN ('waiting', 'ready') AND g.seats_taken < g.max_players
+          AND NOT EXISTS (SELECT 1 FROM user_games ug WHERE ug.user_id = ? AND ug.game_id = g.id)
+        ORDER BY g.seats_taken DESC, g.id
+        LIMIT ?
+    ''', (user_id, limit)).fetchall()
+
+def free_roles(roles_taken):
+    return [role for i, role in enumerate(ROLES) if not roles_taken & (1 << i)]
+
+@api.route('/api/lobby', methods=['GET'])
+@token_required
+def get_lobby(current_user):
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
     
-    try:
-        # Add user to game
-        conn.execute('''
-            INSERT INTO user_games (user_id, game_id, role)
-            VALUES (?, ?, ?)
-        ''', (current_user['id'], game_id, assigned_role))
-        
-        # Update game data
-        game_data['players'].append({
-            'id': current_user['id'],
-            'name': current_user['name'],
-            'role': assigned_role,
-            'position': 'start',
-            'collected_particles': []
-        })
+    conn = get_db_connection()
+    games = open_games(conn, current_user['id'], limit)
+    conn.close()
+    
+    return jsonify({
+        'games': [{
+            'id': game['id'],
+            'name': game['name'],
+            'status': game['status'],
+            'creator_name': game['creator_name'],
+            'created_at': game['created_at'],
+            'players': game['seats_taken'],
+            'max_players': game['max_players'],
+            'free_seats': game['max_players'] - game['seats_taken'],
+            'available_roles': free_roles(game['roles_taken'])
+        } for game in games]
+    }), 200
+
+# Join the best open game. A candidate whose seat was taken between the read
+# and the claim is skipped for the next one.
+@api.route('/api/lobby/quickjoin', methods=['POST'])
+@token_required
+def quick_join(current_user):
+    conn = get_db_connection()
+    
+    for game in open_games(conn, current_user['id'], QUICKJOIN_CANDIDATES):
+        role = claim_seat(conn, game)
+        if role is None:
+            continue
         
-        # If game now has enough players, update status
-        if player_count + 1 >= 2:  # Minimum 2 players to start
-            game_data['status'] = 'ready'
-            conn.execute('''
-                UPDATE games
-                SET status = 'ready', data = ?
-                WHERE id = ?
-            ''', (json.dumps(game_data), game_id))
-        else:
-            conn.execute('''
-                UPDATE games
-                SET data = ?
-                WHERE id = ?
-            ''', (json.dumps(game_data), game_id))
+        try:
+            version, patch, events, game_data = add_player(conn, game, current_user, role)
+        except (sqlite3.IntegrityError, VersionConflict):
+            # Joined concurrently by another request of this user
+            conn.close()
+            conn = get_db_connection()
+            continue
         
         conn.commit()
         conn.close()
         
+        publish_game_update(game['id'], events, version, patch, game_data.get('status'))
+        
         return jsonify({
             'message': 'Successfully joined game',
-            'role': assigned_role,
+            'game_id': game['id'],
+            'role': role,
+            'version': version,
             'game_data': game_data
         }), 200
-        
-    except Exception as e:
-        conn.close()
-        return jsonify({'error': str(e)}), 500
+    
+    conn.close()
+    return jsonify({'error': 'No open game to join'}), 404
 
-@app.route('/api/games/<int:game_id>/start', methods=['POST'])
+@api.route('/api/games/<int:game_id>/start', methods=['POST'])
 @token_required
+@retry_on_conflict
 def start_game(current_user, game_id):
     conn = get_db_connection()
     
@@ -494,30 +1259,126 @@ def start_game(current_user, game_id):
         return jsonify({'error': 'Game cannot be started in its current state'}), 409
     
     # Update game status to 'in_progress'
-    game_data = json.loads(game['data'])
+    started_at = datetime.datetime.utcnow().isoformat()
+    game_data = decode_state(game['data'])
     game_data['status'] = 'in_progress'
-    game_data['started_at'] = datetime.datetime.utcnow().isoformat()
-    game_data['events'].append({
+    game_data['started_at'] = started_at
+    
+    version, patch = save_game_state(conn, game_id, game['data'], game_data, game['version'], status='in_progress')
+    
+    events = append_events(conn, game_id, [{
         'type': 'game_start',
-        'timestamp': datetime.datetime.utcnow().isoformat(),
+        'timestamp': started_at,
         'description': 'Game started by ' + current_user['name']
-    })
-    
-    conn.execute('''
-        UPDATE games
-        SET status = 'in_progress', data = ?, updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    ''', (json.dumps(game_data), game_id))
+    }])
+    if game_engine.snapshot_due(events):
+        record_snapshot(conn, game_id, events[-1]['seq'], game_data)
     
     conn.commit()
     conn.close()
     
+    publish_game_update(game_id, events, version, patch, 'in_progress')
+    
     return jsonify({
         'message': 'Game started successfully',
+        'version': version,
         'game_data': game_data
     }), 200
 
-@app.route('/api/games/<int:game_id>/move', methods=['POST'])
+# Actions a player can take on their turn
+ACTIONS = ('move', 'use_quantum_gate', 'end_turn')
+
+class GameActionError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+# Apply one player action to a GameState, following the game rules, and
+# return the events it produced. Raises GameActionError for invalid actions
+# before changing anything. Shared by the single and batched move endpoints.
+def apply_action(state, current_user, action, target):
+    events = []
+    
+    # A completed game stays in the engine until it is evicted
+    if state.status != 'in_progress':
+        raise GameActionError('Game is not in progress', 409)
+    
+    if action not in ACTIONS:
+        raise GameActionError('Unknown action, expected one of: %s' % ', '.join(ACTIONS))
+    
+    # Find the current player
+    player = state.player(current_user['id'])
+    
+    if player is None:
+        raise GameActionError('Player not found in game data', 500)
+    
+    # Process the action based on player's role
+    if action == 'move':
+        if not target:
+            raise GameActionError('Target location is required for move action')
+        
+        # Update player position
+        state.move_player(player, target)
+        events.append(Event(
+            'player_moved',
+            player_id=current_user['id'],
+            player_name=current_user['name'],
+            position=target
+        ))
+        
+        # Check if player landed on a quantum particle
+        particle = state.particle_at(target)
+        if particle is not None:
+            state.collect_particle(player, particle)
+            events.append(Event(
+                'particle_collected',
+                player_id=current_user['id'],
+                player_name=current_user['name'],
+                particle_type=particle.type,
+                position=target
+            ))
+        
+    elif action == 'use_quantum_gate':
+        if not target:
+            raise GameActionError('Target player is required for quantum gate action')
+        
+        # Apply quantum gate effect
+        events.append(Event(
+            'quantum_gate_used',
+            player_id=current_user['id'],
+            player_name=current_user['name'],
+            target_player=target
+        ))
+        
+    elif action == 'end_turn':
+        # Move to next player's turn
+        state.advance_turn()
+        
+        events.append(Event(
+            'turn_ended',
+            player_id=current_user['id'],
+            player_name=current_user['name'],
+            next_player=state.current_player().name
+        ))
+    
+    # Check win condition
+    if state.is_won():
+        completed_at = datetime.datetime.utcnow().isoformat()
+        state.set('status', 'completed')
+        state.set('winner', current_user['id'])
+        state.set('completed_at', completed_at)
+        
+        events.append(Event(
+            'game_completed',
+            completed_at,
+            winner_id=current_user['id'],
+            winner_name=current_user['name']
+        ))
+    
+    return [event.to_dict() for event in events]
+
+@api.route('/api/games/<int:game_id>/move', methods=['POST'])
 @token_required
 def make_move(current_user, game_id):
     data = request.get_json()
@@ -528,11 +1389,132 @@ def make_move(current_user, game_id):
     action = data.get('action')
     target = data.get('target')
     
+    # Check if game is in progress and user is part of it
+    live = game_engine.get(game_id)
+    if live is None or live.state.player(current_user['id']) is None:
+        return game_not_playable(current_user, game_id)
+    
+    try:
+        version, patch, events, game_data = game_engine.update(
+            game_id, lambda state: apply_action(state, current_user, action, target),
+            want_state=not wants_delta())
+    except GameActionError as e:
+        return jsonify({'error': e.message}), e.status
+    except GameNotLive:
+        return game_not_playable(current_user, game_id)
+    
+    # Delta mode: return only the patch against the previous version
+    if wants_delta():
+        return jsonify({
+            'message': 'Move processed successfully',
+            'version': version,
+            'patch': patch,
+            'events': events
+        }), 200
+    
+    return jsonify({
+        'message': 'Move processed successfully',
+        'version': version,
+        'game_data': game_data,
+        'events': events
+    }), 200
+
+@api.route('/api/games/<int:game_id>/moves', methods=['POST'])
+@token_required
+def make_moves(current_user, game_id):
+    data = request.get_json()
+    actions = data.get('actions') if data else None
+    
+    if not isinstance(actions, list) or not actions:
+        return jsonify({'error': 'A list of actions is required'}), 400
+    
+    # Maximum number of actions accepted by one batched move request
+    max_actions = current_app.config['MAX_BATCH_ACTIONS']
+    if len(actions) > max_actions:
+        return jsonify({'error': 'At most %d actions per batch' % max_actions}), 400
+    
+    if not all(isinstance(item, dict) and 'action' in item for item in actions):
+        return jsonify({'error': 'Action is required'}), 400
+    
+    # Check if game is in progress and user is part of it
+    live = game_engine.get(game_id)
+    if live is None or live.state.player(current_user['id']) is None:
+        return game_not_playable(current_user, game_id)
+    
+    results = []
+    
+    # Apply actions in order against the same state. Processing stops at the
+    # first failing action, exactly as if the moves had been sent one by one.
+    def apply_batch(state):
+        del results[:]
+        events = []
+        
+        for index, item in enumerate(actions):
+            result = {'index': index, 'action': item.get('action')}
+            results.append(result)
+            
+            if state.status != 'in_progress':
+                result.update({'status': 409, 'error': 'Game is not in progress'})
+                break
+            
+            try:
+                action_events = apply_action(state, current_user, item.get('action'), item.get('target'))
+            except GameActionError as e:
+                result.update({'status': e.status, 'error': e.message})
+                break
+            
+            result.update({'status': 200, 'events': action_events})
+            events.extend(action_events)
+        
+        # Nothing applied: leave the game untouched
+        if results[0]['status'] != 200:
+            raise GameActionError(results[0]['error'], results[0]['status'])
+        
+        return events
+    
+    try:
+        version, patch, events, game_data = game_engine.update(game_id, apply_batch,
+                                                               want_state=not wants_delta())
+    except GameActionError as e:
+        return jsonify({'error': e.message, 'results': results}), e.status
+    except GameNotLive:
+        return game_not_playable(current_user, game_id)
+    
+    applied = sum(1 for result in results if result['status'] == 200)
+    
+    response = {
+        'message': 'Moves processed successfully' if applied == len(actions) else 'Moves partially processed',
+        'applied': applied,
+        'results': results,
+        'version': version
+    }
+    
+    # Delta mode: return only the patch against the previous version
+    if wants_delta():
+        response['patch'] = patch
+    else:
+        response['game_data'] = game_data
+    
+    return jsonify(response), 200
+
+@api.route('/api/games/<int:game_id>/events', methods=['GET'])
+@token_required
+def get_game_events(current_user, game_id):
+    # Keyset pagination over the event log: return events with seq > after
+    after = request.args.get('after', 0, type=int)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    
+    # Make sure events still held by the engine are in the log. The flush
+    # takes a connection of its own, so it must run before this handler
+    # holds one: with every pooled connection held by a request waiting for
+    # a flush, nothing could ever be flushed.
+    game_engine.flush(game_id)
+    
     conn = get_db_connection()
     
-    # Check if game exists and user is part of it
+    # Check if user is part of the game
     user_game = conn.execute('''
-        SELECT ug.role, g.data, g.status
+        SELECT g.archived_at
         FROM user_games ug
         JOIN games g ON ug.game_id = g.id
         WHERE ug.user_id = ? AND ug.game_id = ?
@@ -540,117 +1522,469 @@ def make_move(current_user, game_id):
     
     if not user_game:
         conn.close()
-        return jsonify({'error': 'Game not found or you are not part of it'}), 404
+        return jsonify({'error': 'Game not found or you do not have access'}), 404
     
-    if user_game['status'] != 'in_progress':
+    if user_game['archived_at'] is not None:
+        conn.close()
+        rows = game_archive.events(game_id, after, limit + 1)
+    else:
+        rows = conn.execute('''
+            SELECT seq, data
+            FROM game_events
+            WHERE game_id = ? AND seq > ?
+            ORDER BY seq
+            LIMIT ?
+        ''', (game_id, after, limit + 1)).fetchall()
+        
         conn.close()
-        return jsonify({'error': 'Game is not in progress'}), 409
     
-    game_data = json.loads(user_game['data'])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
     
-    # Find the current player
-    current_player = None
-    player_index = -1
-    for i, player in enumerate(game_data['players']):
-        if player['id'] == current_user['id']:
-            current_player = player
-            player_index = i
-            break
-    
-    if not current_player:
+    events = []
+    for row in rows:
+        event = json.loads(row['data'])
+        event['seq'] = row['seq']
+        events.append(event)
+    
+    return jsonify({
+        'events': events,
+        'next_cursor': rows[-1]['seq'] if rows else after,
+        'has_more': has_more
+    }), 200
+
+@api.route('/api/games/<int:game_id>/replay', methods=['GET'])
+@token_required
+def replay_game(current_user, game_id):
+    # State after event seq `at` (default: the latest event)
+    at = request.args.get('at', type=int)
+    
+    # Events still held by the engine go to the log first; the flush takes
+    # its own connection, so none may be held yet
+    game_engine.flush(game_id)
+    
+    conn = get_db_connection()
+    
+    # Check if user is part of the game
+    user_game = conn.execute('''
+        SELECT g.archived_at
+        FROM user_games ug
+        JOIN games g ON ug.game_id = g.id
+        WHERE ug.user_id = ? AND ug.game_id = ?
+    ''', (current_user['id'], game_id)).fetchone()
+    
+    if not user_game:
         conn.close()
-        return jsonify({'error': 'Player not found in game data'}), 500
+        return jsonify({'error': 'Game not found or you do not have access'}), 404
     
-    # Process the action based on player's role
-    if action == 'move':
-        if not target:
+    # Events and snapshots of archived games are in the archive
+    if user_game['archived_at'] is not None:
+        conn.close()
+        conn = track_connection(game_archive.connection())
+    
+    last_seq = conn.execute('''
+        SELECT COALESCE(MAX(seq), 0) AS seq FROM game_events WHERE game_id = ?
+    ''', (game_id,)).fetchone()['seq']
+    
+    if at is None:
+        at = last_seq
+    
+    if not 0 <= at <= last_seq:
+        conn.close()
+        return jsonify({'error': 'Event %d not found in this game' % at}), 404
+    
+    # Nearest snapshot at or before the event, plus the events after it
+    snapshot = conn.execute('''
+        SELECT seq, data
+        FROM game_snapshots
+        WHERE game_id = ? AND seq <= ?
+        ORDER BY seq DESC
+        LIMIT 1
+    ''', (game_id, at)).fetchone()
+    
+    if not snapshot:
+        conn.close()
+        return jsonify({'error': 'Game history before event %d is not available' % at}), 404
+    
+    rows = conn.execute('''
+        SELECT seq, data
+        FROM game_events
+        WHERE game_id = ? AND seq > ? AND seq <= ?
+        ORDER BY seq
+    ''', (game_id, snapshot['seq'], at)).fetchall()
+    
+    conn.close()
+    
+    state = GameState.from_dict(decode_state(snapshot['data']))
+    for row in rows:
+        state.apply_event(json.loads(row['data']))
+    
+    return jsonify({
+        'replay': {
+            'game_id': game_id,
+            'seq': at,
+            'last_seq': last_seq,
+            'snapshot_seq': snapshot['seq'],
+            'events_applied': len(rows),
+            'data': state.to_dict()
+        }
+    }), 200
+
+# Events read per query while exporting a game
+EXPORT_BATCH_SIZE = 500
+
+@api.route('/api/games/<int:game_id>/export', methods=['GET'])
+@token_required
+def export_game(current_user, game_id):
+    conn = get_db_connection()
+    
+    # Check if user is part of the game
+    game = conn.execute('''
+        SELECT g.id, g.name, g.status, g.version, g.created_at, g.updated_at, g.archived_at,
+               u.name as creator_name
+        FROM user_games ug
+        JOIN games g ON ug.game_id = g.id
+        JOIN users u ON g.created_by = u.id
+        WHERE ug.user_id = ? AND ug.game_id = ?
+    ''', (current_user['id'], game_id)).fetchone()
+    
+    if not game:
+        conn.close()
+        return jsonify({'error': 'Game not found or you do not have access'}), 404
+    
+    players = conn.execute('''
+        SELECT u.id, u.name, ug.role
+        FROM user_games ug
+        JOIN users u ON ug.user_id = u.id
+        WHERE ug.game_id = ?
+    ''', (game_id,)).fetchall()
+    
+    conn.close()
+    
+    # The body is generated after the request context is gone, so keep the
+    # database (or archive) itself
+    if game['archived_at'] is not None:
+        source = game_archive._get_current_object()
+    else:
+        game_engine.flush(game_id)
+        source = db_pool._get_current_object()
+    
+    header = dict(game, players=[dict(player) for player in players])
+    
+    # One JSON document per line: the game, then its events in order, each
+    # snapshot right after the event it follows (seq 0: the initial state)
+    def generate():
+        yield json.dumps({'game': header}) + '\n'
+        
+        conn = source.connection()
+        try:
+            snapshots = conn.execute('''
+                SELECT seq, data FROM game_snapshots WHERE game_id = ? ORDER BY seq
+            ''', (game_id,)).fetchall()
+        finally:
             conn.close()
-            return jsonify({'error': 'Target location is required for move action'}), 400
         
-        # Update player position
-        game_data['players'][player_index]['position'] = target
+        def snapshot_line(row):
+            return json.dumps({'snapshot': {'seq': row['seq'], 'data': decode_state(row['data'])}}) + '\n'
         
-        # Check if player landed on a quantum particle
-        for particle_index, particle in enumerate(game_data['quantum_particles']):
-            if particle['position'] == target:
-                # Collect the particle
-                game_data['players'][player_index]['collected_particles'].append(particle)
-                game_data['quantum_particles'].pop(particle_index)
-                
-                # Add event
-                game_data['events'].append({
-                    'type': 'particle_collected',
-                    'timestamp': datetime.datetime.utcnow().isoformat(),
-                    'player_id': current_user['id'],
-                    'player_name': current_user['name'],
-                    'particle_type': particle['type'],
-                    'position': target
-                })
+        after = 0
+        index = 0
+        while True:
+            conn = source.connection()
+            try:
+                rows = conn.execute('''
+                    SELECT seq, data
+                    FROM game_events
+                    WHERE game_id = ? AND seq > ?
+                    ORDER BY seq
+                    LIMIT ?
+                ''', (game_id, after, EXPORT_BATCH_SIZE)).fetchall()
+            finally:
+                conn.close()
+            
+            for row in rows:
+                while index < len(snapshots) and snapshots[index]['seq'] < row['seq']:
+                    yield snapshot_line(snapshots[index])
+                    index += 1
+                event = json.loads(row['data'])
+                event['seq'] = row['seq']
+                yield json.dumps({'event': event}) + '\n'
+            
+            if len(rows) < EXPORT_BATCH_SIZE:
                 break
+            after = rows[-1]['seq']
         
-    elif action == 'use_quantum_gate':
-        if not target:
-            conn.close()
-            return jsonify({'error': 'Target player is required for quantum gate action'}), 400
-        
-        # Apply quantum gate effect
-        game_data['events'].append({
-            'type': 'quantum_gate_used',
-            'timestamp': datetime.datetime.utcnow().isoformat(),
-            'player_id': current_user['id'],
-            'player_name': current_user['name'],
-            'target_player': target
+        for row in snapshots[index:]:
+            yield snapshot_line(row)
+    
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Content-Disposition': 'attachment; filename="game-%d.ndjson"' % game_id
+    })
+
+# Missed events read per query when a stream resumes from Last-Event-ID
+STREAM_REPLAY_BATCH = 500
+
+# Events of a game after seq `after`, from a ConnectionPool or GameArchive
+def read_events(source, game_id, after, limit):
+    conn = source.connection()
+    try:
+        return conn.execute('''
+            SELECT seq, data
+            FROM game_events
+            WHERE game_id = ? AND seq > ?
+            ORDER BY seq
+            LIMIT ?
+        ''', (game_id, after, limit)).fetchall()
+    finally:
+        conn.close()
+
+# An open /stream: the subscription plus the snapshot it starts with and,
+# when resuming, every event the client missed. Shared by the Flask route
+# and the ASGI server (asgi.py). The stream outlives the request context,
+# so it reads missed events from the database (or archive) itself.
+class GameStream:
+    def __init__(self, broker, subscription, game, source, last_event_id):
+        self.broker = broker
+        self.subscription = subscription
+        self.game = game
+        self.source = source
+        self.resume_after = last_event_id
+        self.last_seq = last_event_id or 0
+        self.version = game['version']
+    
+    # The messages sent before any live update
+    def opening(self):
+        yield 'retry: 3000\n\n'
+        yield format_sse('state', {
+            'version': self.version,
+            'status': self.game['status'],
+            'data': decode_state(self.game['data'])
         })
         
-    elif action == 'end_turn':
-        # Move to next player's turn
-        game_data['current_turn'] = (game_data['current_turn'] + 1) % len(game_data['players'])
-        
-        # Add event
-        game_data['events'].append({
-            'type': 'turn_ended',
-            'timestamp': datetime.datetime.utcnow().isoformat(),
-            'player_id': current_user['id'],
-            'player_name': current_user['name'],
-            'next_player': game_data['players'][game_data['current_turn']]['name']
-        })
+        if self.resume_after is None:
+            return
+        
+        # Page through all missed events. Those committed meanwhile are also
+        # queued by the broker, and format() skips them there.
+        while True:
+            rows = read_events(self.source, self.game['id'], self.last_seq, STREAM_REPLAY_BATCH)
+            for row in rows:
+                event = json.loads(row['data'])
+                event['seq'] = row['seq']
+                self.last_seq = row['seq']
+                yield format_sse('game_event', event, row['seq'])
+            
+            if len(rows) < STREAM_REPLAY_BATCH:
+                break
     
-    # Check win condition
-    all_particles_collected = len(game_data['quantum_particles']) == 0
-    any_player_at_start = any(player['position'] == 'start' and len(player['collected_particles']) > 0 for player in game_data['players'])
-    
-    if all_particles_collected and any_player_at_start:
-        game_data['status'] = 'completed'
-        game_data['winner'] = current_user['id']
-        game_data['completed_at'] = datetime.datetime.utcnow().isoformat()
-        
-        # Add event
-        game_data['events'].append({
-            'type': 'game_completed',
-            'timestamp': datetime.datetime.utcnow().isoformat(),
-            'winner_id': current_user['id'],
-            'winner_name': current_user['name']
-        })
+    # Format a broker message, or None if the snapshot or replay covered it
+    def format(self, message):
+        if message['event'] == 'game_event':
+            if message['id'] <= self.last_seq:
+                return None
+            self.last_seq = message['id']
+        elif message['event'] == 'delta':
+            if message['data']['version'] <= self.version:
+                return None
+            self.version = message['data']['version']
         
-        conn.execute('''
-            UPDATE games
-            SET status = 'completed', data = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (json.dumps(game_data), game_id))
-    else:
-        conn.execute('''
-            UPDATE games
-            SET data = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (json.dumps(game_data), game_id))
+        return format_sse(message['event'], message['data'], message.get('id'))
     
-    conn.commit()
+    def close(self):
+        self.broker.unsubscribe(self.subscription)
+
+# Check access and open a stream of a game. Returns (stream, None) or
+# (None, error response). With a loop, the subscription is consumed from
+# that asyncio event loop.
+def open_game_stream(current_user, game_id, last_event_id, loop=None):
+    try:
+        last_event_id = int(last_event_id) if last_event_id is not None else None
+    except ValueError:
+        last_event_id = None
+    
+    # Check if user is part of the game
+    if not is_player(current_user['id'], game_id):
+        return None, (jsonify({'error': 'Game not found or you do not have access'}), 404)
+    
+    # Subscribe before reading the snapshot so no update falls in between.
+    # The stream outlives the request context, so keep the broker itself.
+    # The flush takes its own connection, so none is held here yet.
+    game_broker = broker._get_current_object()
+    subscription = game_broker.subscribe(game_id, loop)
+    game_engine.flush(game_id)
+    
+    conn = get_db_connection()
+    game = conn.execute('SELECT id, status, version, data, archived_at FROM games WHERE id = ?', (game_id,)).fetchone()
     conn.close()
     
-    return jsonify({
-        'message': 'Move processed successfully',
-        'game_data': game_data
-    }), 200
+    # Events of archived games are in the archive
+    if game['archived_at'] is not None:
+        game = dict(game, data=load_game_data(game))
+        source = game_archive._get_current_object()
+    else:
+        source = db_pool._get_current_object()
+    
+    return GameStream(game_broker, subscription, game, source, last_event_id), None
+
+STREAM_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+}
+
+@api.route('/api/games/<int:game_id>/stream', methods=['GET'])
+@token_required
+def stream_game(current_user, game_id):
+    # Resume point: the last event seq the client has seen
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    
+    stream, error = open_game_stream(current_user, game_id, last_event_id)
+    if error:
+        return error
+    
+    # Seconds between SSE heartbeats on an idle stream
+    heartbeat = current_app.config['STREAM_HEARTBEAT']
+    
+    def generate():
+        try:
+            yield from stream.opening()
+            
+            while not stream.subscription.overflowed:
+                message = stream.subscription.get(timeout=heartbeat)
+                
+                if message is None:
+                    yield ': heartbeat\n\n'
+                    continue
+                
+                chunk = stream.format(message)
+                if chunk is not None:
+                    yield chunk
+        finally:
+            stream.close()
+    
+    return Response(generate(), mimetype='text/event-stream', headers=STREAM_HEADERS)
+
+# Engine callbacks run on the flusher thread too, outside any request
+def with_app_context(app, f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if has_app_context():
+            return f(*args, **kwargs)
+        with app.app_context():
+            return f(*args, **kwargs)
+    return wrapper
+
+class Services:
+    def __init__(self, app, config):
+        # Request and SQL metrics, exposed at GET /metrics
+        self.metrics = Metrics(sample_rate=config['METRICS_SAMPLE_RATE'])
+        
+        # Shared connection pool (WAL mode, pragmas applied once per connection)
+        self.db_pool = ConnectionPool(config['DATABASE'], max_size=config['DB_POOL_SIZE'])
+        self.metrics.instrument_pool(self.db_pool)
+        
+        # Live game updates for /stream subscribers
+        self.broker = GameBroker(queue_size=config['STREAM_QUEUE_SIZE'])
+        
+        # Games in progress live in memory; SQLite is updated by write-behind
+        self.game_engine = GameEngine(
+            with_app_context(app, load_live_game),
+            with_app_context(app, persist_live_game),
+            on_update=with_app_context(app, publish_game_update),
+            flush_interval=config['GAME_FLUSH_INTERVAL'],
+            idle_timeout=config['GAME_IDLE_TIMEOUT'],
+            history=config['DELTA_HISTORY'],
+            snapshot_interval=config['SNAPSHOT_INTERVAL']
+        )
+        # Flush games in progress when the process exits without close()
+        atexit.register(self.game_engine.stop)
+        
+        # Password hashing runs on its own process pool, sized to the machine
+        self.password_hasher = PasswordHasher(
+            method=config['PASSWORD_HASH_METHOD'],
+            workers=config['HASH_WORKERS'],
+            max_pending=config['HASH_QUEUE_SIZE']
+        )
+        
+        # Completed games move to a separate database file after a while
+        self.archive = GameArchive(config['ARCHIVE_DATABASE'] or os.path.splitext(config['DATABASE'])[0] + '-archive.db')
+        self.archiver = Archiver(
+            self.db_pool,
+            self.archive,
+            archive_after=config['ARCHIVE_AFTER'],
+            interval=config['ARCHIVE_INTERVAL'],
+            batch_size=config['ARCHIVE_BATCH_SIZE'],
+            vacuum_pages=config['VACUUM_PAGES']
+        )
+        
+        self.principal_cache = LRUCache(maxsize=config['PRINCIPAL_CACHE_SIZE'], ttl=config['PRINCIPAL_CACHE_TTL'])
+        self.token_cache = LRUCache(maxsize=config['TOKEN_CACHE_SIZE'])
+        
+        # Assembled GET /api/games/<id> responses of games not in progress
+        # (those are served by the engine), dropped on every committed
+        # change; the ttl bounds how long changes made by other processes
+        # go unseen
+        self.game_views = ReadThroughCache(
+            load_game_view,
+            maxsize=config['GAME_VIEW_CACHE_SIZE'],
+            ttl=config['GAME_VIEW_TTL'],
+            cacheable=lambda view: view['status'] != 'in_progress'
+        )
+        self.token_denylist = TokenDenylist(self.db_pool)
+        
+        # Outcomes of retry_on_conflict
+        self.conflict_stats = ConflictStats()
+        
+        # Requests per user (or client address) and route
+        self.rate_limiter = RateLimiter(
+            parse_limits(config['RATE_LIMITS']) if config['RATE_LIMITING'] else {},
+            max_keys=config['RATE_LIMIT_MAX_KEYS']
+        )
+        
+        self.metrics.add_stats('db_pool', self.db_pool.stats)
+        self.metrics.add_stats('game_engine', self.game_engine.stats)
+        self.metrics.add_stats('game_conflicts', self.conflict_stats.stats)
+        self.metrics.add_stats('stream_broker', self.broker.stats)
+        self.metrics.add_stats('password_hasher', self.password_hasher.stats)
+        self.metrics.add_stats('principal_cache', self.principal_cache.stats)
+        self.metrics.add_stats('token_cache', self.token_cache.stats)
+        self.metrics.add_stats('game_views', self.game_views.stats)
+        self.metrics.add_stats('token_denylist', self.token_denylist.stats)
+        self.metrics.add_stats('rate_limiter', self.rate_limiter.stats)
+        self.metrics.add_stats('archiver', self.archiver.stats)
+    
+    # Flush games in progress and release processes and connections
+    def close(self):
+        self.archiver.stop()
+        self.game_engine.stop()
+        atexit.unregister(self.game_engine.stop)
+        self.password_hasher.shutdown()
+        self.db_pool.close_all()
+        self.archive.pool.close_all()
+
+# Build the Flask app. Nothing here touches the database: connections, the
+# engine's flusher thread and the hashing processes are started on first
+# use, and the schema is created separately by `python manage.py init-db`.
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.update(config_from_env())
+    if config:
+        app.config.update(config)
+    
+    CORS(app)  # Enable CORS for all routes
+    
+    services = Services(app, app.config)
+    app.extensions['entanglion'] = services
+    
+    # The archiver thread starts with the first request, not at import
+    app.before_request(services.archiver.start)
+    app.teardown_appcontext(release_db_connections)
+    
+    services.metrics.init_app(app)
+    app.register_blueprint(api)
+    return app
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    app = create_app()
+    with app.app_context():
+        init_db()
+    app.run(debug=True, port=5000, threaded=True)
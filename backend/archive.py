@@ -0,0 +1,263 @@
+
+import datetime
+import logging
+import threading
+
+from database import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Completed games are moved out of the main database into a separate SQLite
+# file once they have not changed for a while. Their games row stays behind
+# as a small stub (name, status, version, archived_at; data is '{}') so
+# listings and membership checks are unchanged, while the state and the
+# event log, the bulk of a game, go to the archive. Readers check
+# games.archived_at and load the rest from the archive. Its game_events and
+# game_snapshots tables have the same layout as in the main database.
+
+ARCHIVE_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS games (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        status TEXT NOT NULL,
+        created_by INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        data BLOB NOT NULL,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS game_events (
+        game_id INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        data TEXT NOT NULL,
+        created_at TIMESTAMP,
+        PRIMARY KEY (game_id, seq)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS game_snapshots (
+        game_id INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        data BLOB NOT NULL,
+        PRIMARY KEY (game_id, seq)
+    ) WITHOUT ROWID
+    ''',
+)
+
+# SQLite auto_vacuum modes
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class GameArchive:
+    def __init__(self, database):
+        self.pool = ConnectionPool(database, max_size=2)
+        self._schema_ready = False
+
+    def connection(self):
+        conn = self.pool.connection()
+        if not self._schema_ready:
+            try:
+                for statement in ARCHIVE_SCHEMA:
+                    conn.execute(statement)
+                conn.commit()
+            except Exception:
+                conn.close()
+                raise
+            self._schema_ready = True
+        return conn
+
+    # Copy games, their events and snapshots; rows already archived are
+    # replaced, so an interrupted run can simply be repeated
+    def store(self, games, events, snapshots):
+        conn = self.connection()
+        try:
+            conn.executemany('''
+                INSERT OR REPLACE INTO games (id, name, status, created_by, version, data, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(game['id'], game['name'], game['status'], game['created_by'], game['version'],
+                   game['data'], game['created_at'], game['updated_at']) for game in games])
+            conn.executemany('''
+                INSERT OR REPLACE INTO game_events (game_id, seq, type, data, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(event['game_id'], event['seq'], event['type'], event['data'], event['created_at'])
+                  for event in events])
+            conn.executemany('''
+                INSERT OR REPLACE INTO game_snapshots (game_id, seq, data)
+                VALUES (?, ?, ?)
+            ''', [(snapshot['game_id'], snapshot['seq'], snapshot['data']) for snapshot in snapshots])
+            conn.commit()
+        finally:
+            conn.close()
+
+    # Raw (encoded) state of an archived game, or None
+    def load_data(self, game_id):
+        conn = self.connection()
+        try:
+            row = conn.execute('SELECT data FROM games WHERE id = ?', (game_id,)).fetchone()
+        finally:
+            conn.close()
+        return row['data'] if row else None
+
+    def events(self, game_id, after, limit):
+        conn = self.connection()
+        try:
+            return conn.execute('''
+                SELECT seq, data
+                FROM game_events
+                WHERE game_id = ? AND seq > ?
+                ORDER BY seq
+                LIMIT ?
+            ''', (game_id, after, limit)).fetchall()
+        finally:
+            conn.close()
+
+
+# Release free pages (at most `pages`, all by default) if the database uses
+# incremental auto-vacuum, then let SQLite refresh its planner statistics.
+# Returns the number of bytes released.
+def compact(conn, pages=None):
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    released = 0
+
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        before = conn.execute('PRAGMA page_count').fetchone()[0]
+        if pages:
+            conn.execute('PRAGMA incremental_vacuum(%d)' % pages).fetchall()
+        else:
+            conn.execute('PRAGMA incremental_vacuum').fetchall()
+        released = (before - conn.execute('PRAGMA page_count').fetchone()[0]) * page_size
+    conn.execute('PRAGMA optimize')
+    return released
+
+
+# Background job moving completed games unchanged for archive_after seconds to
+# the archive, batch_size games per transaction, every interval seconds.
+class Archiver:
+    def __init__(self, pool, archive, archive_after=7 * 86400, interval=3600, batch_size=100, vacuum_pages=1000):
+        self.pool = pool
+        self.archive = archive
+        self.archive_after = archive_after
+        self.interval = interval
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.archived = 0
+        self.skipped = 0
+        self.bytes_moved = 0
+        self.bytes_reclaimed = 0
+        self.failures = 0
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='game-archiver', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+                logger.exception('Archiving games failed')
+
+    # Archive every game that is due, then compact the main database
+    def run_once(self):
+        archived = 0
+        while not self._stopping.is_set():
+            count = self.archive_batch()
+            archived += count
+            if count < self.batch_size:
+                break
+
+        conn = self.pool.connection()
+        try:
+            reclaimed = compact(conn, self.vacuum_pages)
+        finally:
+            conn.close()
+
+        with self._lock:
+            self.runs += 1
+            self.bytes_reclaimed += reclaimed
+        return {'archived': archived, 'bytes_reclaimed': reclaimed}
+
+    def archive_batch(self):
+        cutoff = (datetime.datetime.utcnow() - datetime.timedelta(seconds=self.archive_after)).strftime('%Y-%m-%d %H:%M:%S')
+
+        conn = self.pool.connection()
+        try:
+            games = conn.execute('''
+                SELECT id, name, status, created_by, version, data, created_at, updated_at
+                FROM games
+                WHERE status = 'completed' AND updated_at < ? AND archived_at IS NULL
+                ORDER BY updated_at, id
+                LIMIT ?
+            ''', (cutoff, self.batch_size)).fetchall()
+            if not games:
+                return 0
+
+            events = {}
+            snapshots = []
+            for game in games:
+                events[game['id']] = conn.execute('''
+                    SELECT game_id, seq, type, data, created_at FROM game_events WHERE game_id = ?
+                ''', (game['id'],)).fetchall()
+                snapshots.extend(conn.execute('''
+                    SELECT game_id, seq, data FROM game_snapshots WHERE game_id = ?
+                ''', (game['id'],)).fetchall())
+
+            # The archive is written first: if we stop before the main
+            # database commits, the games are archived again next time
+            self.archive.store(games, [event for rows in events.values() for event in rows], snapshots)
+
+            archived = skipped = moved = 0
+            for game in games:
+                cursor = conn.execute('''
+                    UPDATE games SET data = '{}', archived_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND version = ? AND archived_at IS NULL
+                ''', (game['id'], game['version']))
+                if cursor.rowcount != 1:
+                    skipped += 1
+                    continue
+                conn.execute('DELETE FROM game_events WHERE game_id = ?', (game['id'],))
+                conn.execute('DELETE FROM game_deltas WHERE game_id = ?', (game['id'],))
+                conn.execute('DELETE FROM game_snapshots WHERE game_id = ?', (game['id'],))
+                archived += 1
+                moved += len(game['data']) + sum(len(event['data']) for event in events[game['id']])
+            conn.commit()
+        finally:
+            conn.close()
+
+        with self._lock:
+            self.archived += archived
+            self.skipped += skipped
+            self.bytes_moved += moved
+        return len(games)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'runs': self.runs,
+                'archived': self.archived,
+                'skipped': self.skipped,
+                'bytes_moved': self.bytes_moved,
+                'bytes_reclaimed': self.bytes_reclaimed,
+                'failures': self.failures,
+            }
@@ -0,0 +1,250 @@
+
+# ASGI server mode, for many concurrent idle connections:
+#
+#   python asgi.py
+#   uvicorn asgi:app --port 5000
+#
+# Game streams (GET /api/games/<id>/stream) are served natively on the
+# event loop: an open stream costs a task and a queue, not a thread. Every
+# other request runs the Flask app on a bounded thread pool, so the routes
+# and JSON responses are exactly those of app.py and no database access,
+# JWT decoding or password hashing blocks the event loop. Like wsgi.py,
+# this runs as one process (no uvicorn --workers), as the game engine must
+# be the only writer of the games it holds.
+
+import asyncio
+import io
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from app import STREAM_HEADERS, authenticate, create_app, open_game_stream
+
+STREAM_PATH = re.compile(r'^/api/games/(\d+)/stream$')
+
+# Request bodies are small JSON documents
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class ASGIApp:
+    def __init__(self, flask_app, threads=None):
+        self.flask_app = flask_app
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads or int(os.environ.get('ASGI_THREADS', 32)),
+            thread_name_prefix='asgi-worker'
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        match = STREAM_PATH.match(scope['path'])
+        if match and scope['method'] == 'GET':
+            await self.stream(scope, receive, send, int(match.group(1)))
+        else:
+            await self.call_flask(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self.flask_app.extensions['entanglion'].close)
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    # Run the Flask app for one request on the thread pool
+    async def call_flask(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if len(body) > MAX_BODY_SIZE:
+                await send_response(send, 413, [(b'content-type', b'application/json')],
+                                    b'{"error": "Request body too large"}')
+                return
+            if not message.get('more_body'):
+                break
+
+        status, headers, result, chunks, chunk = await self.run(self.call_wsgi, wsgi_environ(scope, bytes(body)))
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            # Streamed responses (the NDJSON export) are produced on the
+            # thread pool a chunk at a time and forwarded as they come. A
+            # response with a Content-Length is complete once that much is
+            # sent, which saves asking the thread pool for the end
+            remaining = dict(headers).get(b'content-length')
+            remaining = int(remaining) if remaining is not None else None
+            while chunk is not None:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                if remaining is not None:
+                    remaining -= len(chunk)
+                    if remaining <= 0:
+                        break
+                chunk = await self.run(next, chunks, None)
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(result, 'close'):
+                await self.run(result.close)
+
+    # Start the response and produce its first chunk, which for a JSON
+    # response is the whole body
+    def call_wsgi(self, environ):
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [int(status.split(' ', 1)[0]),
+                           [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]]
+
+        result = self.flask_app(environ, start_response)
+        try:
+            chunks = iter(result)
+            chunk = next(chunks, None)
+        except BaseException:
+            if hasattr(result, 'close'):
+                result.close()
+            raise
+        return response[0], response[1], result, chunks, chunk
+
+    # Authorize and take the snapshot on the thread pool, then wait for
+    # updates on the event loop
+    async def stream(self, scope, receive, send, game_id):
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        loop = asyncio.get_running_loop()
+
+        def open_stream():
+            with self.flask_app.app_context():
+                current_user, error = authenticate(headers.get('authorization'), 'stream_game')
+                if error is None:
+                    last_event_id = headers.get('last-event-id', query_param(scope, 'last_event_id'))
+                    stream, error = open_game_stream(current_user, game_id, last_event_id, loop)
+                if error is not None:
+                    response = self.flask_app.make_response(error)
+                    return None, (response.status_code, response.headers.get('Retry-After'), response.get_data())
+                return stream, None
+
+        stream, error = await self.run(open_stream)
+        if error is not None:
+            status, retry_after, content = error
+            headers = [(b'content-type', b'application/json')] + cors_headers()
+            if retry_after:
+                headers.append((b'retry-after', retry_after.encode('latin-1')))
+            await send_response(send, status, headers, content)
+            return
+
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', b'text/event-stream; charset=utf-8')] + cors_headers() + [
+                    (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in STREAM_HEADERS.items()
+                ],
+            })
+            opening = await self.run(lambda: ''.join(stream.opening()))
+            await send_chunk(send, opening)
+
+            heartbeat = self.flask_app.config['STREAM_HEARTBEAT']
+            while not stream.subscription.overflowed:
+                get = asyncio.ensure_future(stream.subscription.get(timeout=heartbeat))
+                await asyncio.wait({get, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    get.cancel()
+                    break
+
+                message = get.result()
+                if message is None:
+                    await send_chunk(send, ': heartbeat\n\n')
+                    continue
+
+                chunk = stream.format(message)
+                if chunk is not None:
+                    await send_chunk(send, chunk)
+
+            if not disconnected.done():
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            disconnected.cancel()
+            stream.close()
+
+
+def cors_headers():
+    return [(b'access-control-allow-origin', b'*')]
+
+
+def query_param(scope, name):
+    return parse_qs(scope['query_string'].decode('latin-1')).get(name, [None])[0]
+
+
+def wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(len(body)),
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = 'HTTP_' + name
+            environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def send_response(send, status, headers, content):
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': content})
+
+
+async def send_chunk(send, text):
+    await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+
+app = ASGIApp(create_app())
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit('The ASGI server mode needs uvicorn: pip install uvicorn')
+
+    from app import init_db
+
+    with app.flask_app.app_context():
+        init_db()
+    uvicorn.run(app, host='127.0.0.1', port=int(os.environ.get('PORT', 5000)), backlog=4096)
@@ -0,0 +1,122 @@
+
+# Size and speed of the games.data codecs.
+#
+#   python benchmarks/codec_bench.py                      # synthetic states
+#   python benchmarks/codec_bench.py --database database.db --json
+#
+# With --database, the rows of a real database are used as the sample.
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+
+ROLES = ['quantum_operator', 'navigation_engineer', 'particle_collector', 'quantum_physicist']
+TYPES = ['photon', 'electron', 'qubit', 'entangled_pair']
+
+
+def synthetic_state(players, particles, collected):
+    state = {
+        'board': 'quantum_realm',
+        'player_count': players,
+        'current_turn': 1,
+        'players': [
+            {
+                'id': 1000 + i,
+                'name': 'Player %d' % i,
+                'role': ROLES[i % len(ROLES)],
+                'position': 'sector_%s' % 'abcd'[i % 4],
+                'collected_particles': []
+            } for i in range(players)
+        ],
+        'quantum_particles': [
+            {'id': i + 1, 'type': TYPES[i % len(TYPES)], 'position': 'sector_%d' % i}
+            for i in range(particles)
+        ],
+        'status': 'in_progress',
+        'started_at': '2026-10-18T12:00:00.000000'
+    }
+    for i in range(collected):
+        particle = state['quantum_particles'].pop()
+        state['players'][i % players]['collected_particles'].append(particle)
+    if not state['quantum_particles']:
+        state.update({'status': 'completed', 'winner': 1000, 'completed_at': '2026-10-18T12:30:00.000000'})
+    return state
+
+
+def samples_from_database(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute('SELECT data FROM games').fetchall()
+    conn.close()
+    return [codec.decode(row[0]) for row in rows]
+
+
+def measure(samples, name, repeat):
+    encoded = [codec.encode(sample, name) for sample in samples]
+    size = sum(len(value.encode('utf-8') if isinstance(value, str) else value) for value in encoded)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for sample in samples:
+            codec.encode(sample, name)
+    encode_time = (time.perf_counter() - started) / (repeat * len(samples))
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for value in encoded:
+            codec.decode(value)
+    decode_time = (time.perf_counter() - started) / (repeat * len(samples))
+
+    return {
+        'codec': name,
+        'bytes': size,
+        'bytes_per_row': size / len(samples),
+        'encode_us': encode_time * 1e6,
+        'decode_us': decode_time * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the games.data codecs')
+    parser.add_argument('--database', help='Use the games of this database as samples')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    args = parser.parse_args()
+
+    if args.database:
+        samples = samples_from_database(args.database)
+    else:
+        samples = [
+            synthetic_state(2, 4, 0),
+            synthetic_state(4, 4, 2),
+            synthetic_state(4, 4, 4),
+            synthetic_state(4, 64, 40),
+        ]
+
+    if not samples:
+        sys.exit('No samples')
+
+    names = [name for name in codec.CODECS if name != 'binary+zstd' or codec.zstandard is not None]
+    results = [measure(samples, name, args.repeat) for name in names]
+
+    if args.json:
+        print(json.dumps({'samples': len(samples), 'results': results}, indent=2))
+        return
+
+    baseline = results[0]['bytes']
+    print('%d samples' % len(samples))
+    print('%-12s %10s %7s %11s %11s' % ('codec', 'bytes/row', 'ratio', 'encode us', 'decode us'))
+    for result in results:
+        print('%-12s %10.1f %6.2fx %11.1f %11.1f' % (
+            result['codec'], result['bytes_per_row'], baseline / result['bytes'],
+            result['encode_us'], result['decode_us']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+
+# Load generator for the full game lifecycle.
+#
+# Virtual players register, log in, create and join games, start them and
+# then take turns (move, end_turn) while the other players poll get_game.
+# Games run concurrently on --concurrency threads.
+#
+#   python benchmarks/loadgen.py --players 40 --concurrency 8
+#   python benchmarks/loadgen.py --output results.json
+#   python benchmarks/loadgen.py --compare results.json
+#   python benchmarks/loadgen.py --url http://localhost:5000 --database database.db
+#
+# By default the app runs in-process (Flask test client) against a fresh
+# database in a temporary directory, which also allows counting SQL
+# statements per request. With --url requests go to a running server.
+
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = ['sector_a', 'sector_b', 'sector_c', 'sector_d', 'start']
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, math.ceil(pct / 100.0 * len(values)) - 1))  # nearest rank
+    return values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statements = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, route, status, elapsed, statements=None):
+        with self.lock:
+            self.latencies[route].append(elapsed)
+            self.statuses[route][status] += 1
+            if status >= 400 and status != 409:
+                self.errors[route] += 1
+            if statements is not None:
+                self.statements[route].append(statements)
+
+    def summary(self, wall_time):
+        routes = {}
+        total = 0
+        for route, latencies in sorted(self.latencies.items()):
+            total += len(latencies)
+            statements = self.statements.get(route)
+            routes[route] = {
+                'requests': len(latencies),
+                'errors': self.errors[route],
+                'statuses': dict(self.statuses[route]),
+                'throughput_rps': len(latencies) / wall_time if wall_time else None,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p95_ms': percentile(latencies, 95) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'max_ms': max(latencies) * 1000,
+                'sql_per_request': sum(statements) / len(statements) if statements else None,
+            }
+        return {
+            'requests': total,
+            'wall_time_s': wall_time,
+            'throughput_rps': total / wall_time if wall_time else None,
+            'routes': routes,
+        }
+
+
+# Counts SQL statements per thread via sqlite3 trace callbacks on the
+# app's pooled connections
+class StatementCounter:
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.background = 0
+
+    def install(self, conn):
+        conn.set_trace_callback(self.trace)
+
+    def trace(self, statement):
+        if getattr(self.local, 'active', False):
+            self.local.count += 1
+        else:
+            with self.lock:
+                self.background += 1
+
+    def start(self):
+        self.local.active = True
+        self.local.count = 0
+
+    def stop(self):
+        self.local.active = False
+        return self.local.count
+
+
+class InProcessClient:
+    def __init__(self, app, counter):
+        self.client = app.test_client()
+        self.counter = counter
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'Authorization': 'Bearer ' + token} if token else {}
+        self.counter.start()
+        started = time.perf_counter()
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        elapsed = time.perf_counter() - started
+        statements = self.counter.stop()
+        return response.status_code, response.get_json(silent=True), elapsed, statements
+
+
+class HTTPClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = 'Bearer ' + token
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        elapsed = time.perf_counter() - started
+
+        try:
+            payload = json.loads(payload) if payload else None
+        except ValueError:
+            payload = None
+        return status, payload, elapsed, None
+
+
+def call(client, recorder, route, method, path, token=None, body=None):
+    status, payload, elapsed, statements = client.request(method, path, token, body)
+    recorder.record(route, status, elapsed, statements)
+    return status, payload
+
+
+def play_game(make_client, recorder, game_size, rounds, polls, run_id, index):
+    client = make_client()
+    rng = random.Random(index)
+
+    # Register and log in every player of this game
+    players = []
+    for seat in range(game_size):
+        email = 'bench-%s-%d-%d@example.com' % (run_id, index, seat)
+        call(client, recorder, 'register', 'POST', '/api/register',
+             body={'name': 'Bench %d.%d' % (index, seat), 'email': email, 'password': 'bench-password'})
+        status, payload = call(client, recorder, 'login', 'POST', '/api/login',
+                               body={'email': email, 'password': 'bench-password'})
+        if status != 200:
+            return
+        players.append(payload['token'])
+
+    status, payload = call(client, recorder, 'create_game', 'POST', '/api/games', players[0],
+                           {'name': 'Bench game %d' % index, 'player_count': game_size})
+    if status != 201:
+        return
+    game_id = payload['game']['id']
+
+    for token in players[1:]:
+        call(client, recorder, 'join_game', 'POST', '/api/games/%d/join' % game_id, token)
+    call(client, recorder, 'start_game', 'POST', '/api/games/%d/start' % game_id, players[0])
+
+    # Take turns; everyone else polls the game after each move
+    for turn in range(rounds * game_size):
+        current = players[turn % game_size]
+        status, payload = call(client, recorder, 'make_move', 'POST', '/api/games/%d/move' % game_id, current,
+                               {'action': 'move', 'target': rng.choice(TARGETS)})
+        if status == 409:
+            break  # Game completed
+
+        for token in players:
+            if token is current:
+                continue
+            for _ in range(polls):
+                call(client, recorder, 'get_game', 'GET', '/api/games/%d' % game_id, token)
+
+        status, payload = call(client, recorder, 'make_move', 'POST', '/api/games/%d/move' % game_id, current,
+                               {'action': 'end_turn'})
+        if status == 409:
+            break
+
+    call(client, recorder, 'get_games', 'GET', '/api/games', players[0])
+
+
+def database_size(path):
+    if not path:
+        return None
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(current, baseline):
+    print('\nCompared with %s:' % (baseline.get('commit') or 'baseline'))
+    print('%-12s %14s %14s' % ('route', 'p95 ms', 'sql/request'))
+    for route, stats in current['routes'].items():
+        old = baseline.get('results', {}).get('routes', {}).get(route)
+        if not old:
+            continue
+        p95 = '%+.1f%%' % (100.0 * (stats['p95_ms'] - old['p95_ms']) / old['p95_ms']) if old['p95_ms'] else '-'
+        sql = '-'
+        if stats['sql_per_request'] is not None and old.get('sql_per_request') is not None:
+            sql = '%.1f -> %.1f' % (old['sql_per_request'], stats['sql_per_request'])
+        print('%-12s %14s %14s' % (route, p95, sql))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the game lifecycle')
+    parser.add_argument('--players', type=int, default=20, help='Number of virtual players')
+    parser.add_argument('--game-size', type=int, default=2, help='Players per game (2-4)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Games played at the same time')
+    parser.add_argument('--rounds', type=int, default=10, help='Turns per player')
+    parser.add_argument('--polls', type=int, default=2, help='get_game polls per player per move')
+    parser.add_argument('--url', help='Benchmark a running server instead of the in-process app')
+    parser.add_argument('--database', help='Database file to measure (default: the in-process one)')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', help='Compare with the JSON results of an earlier run')
+    args = parser.parse_args()
+
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    counter = None
+
+    if args.url:
+        make_client = lambda: HTTPClient(args.url)  # noqa: E731
+        database = args.database
+    else:
+        # Fresh database in a scratch directory unless --database is given
+        sys.path.insert(0, BACKEND)
+        from app import create_app, init_db
+
+        if args.database:
+            database = os.path.abspath(args.database)
+        else:
+            database = os.path.join(tempfile.mkdtemp(prefix='entanglion-bench-'), 'database.db')
+        # Every virtual player logs in from the same address
+        app = create_app({'DATABASE': database, 'RATE_LIMITING': False})
+        services = app.extensions['entanglion']
+        with app.app_context():
+            init_db()
+
+        counter = StatementCounter()
+        services.db_pool.close_all()
+        services.db_pool.connect_hooks.append(counter.install)
+        make_client = lambda: InProcessClient(app, counter)  # noqa: E731
+
+    size_before = database_size(database)
+    games = max(1, args.players // args.game_size)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(play_game, make_client, recorder, args.game_size,
+                                   args.rounds, args.polls, run_id, index) for index in range(games)]
+        for future in futures:
+            future.result()
+    wall_time = time.perf_counter() - started
+
+    if not args.url:
+        services.game_engine.flush()
+
+    results = recorder.summary(wall_time)
+    size_after = database_size(database)
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'mode': 'http' if args.url else 'in-process',
+        'config': vars(args),
+        'results': results,
+        'database_bytes_before': size_before,
+        'database_bytes_after': size_after,
+        'database_growth_bytes': size_after - size_before if size_before is not None else None,
+        'background_sql_statements': counter.background if counter else None,
+    }
+
+    print('%d requests in %.2fs (%.1f req/s)' % (results['requests'], wall_time, results['throughput_rps']))
+    print('%-12s %8s %8s %9s %9s %9s %9s' % ('route', 'requests', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'sql/req'))
+    for route, stats in results['routes'].items():
+        sql = '%.1f' % stats['sql_per_request'] if stats['sql_per_request'] is not None else '-'
+        print('%-12s %8d %8d %9.2f %9.2f %9.2f %9s' % (
+            route, stats['requests'], stats['errors'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], sql))
+    if report['database_growth_bytes'] is not None:
+        print('Database grew by %d bytes' % report['database_growth_bytes'])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
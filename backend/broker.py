@@ -0,0 +1,98 @@
+
+import asyncio
+import queue
+import threading
+from collections import defaultdict
+
+
+# One subscriber (e.g. an open SSE stream) to a single game's updates.
+# Messages are buffered in a bounded queue; a subscriber that falls too far
+# behind is marked overflowed and is expected to reconnect and resume.
+class Subscription:
+    def __init__(self, game_id, maxsize):
+        self.game_id = game_id
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize)
+
+    def put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout=None):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+# Subscription consumed from an asyncio event loop (the ASGI server). put()
+# may be called from any thread and hands the message over to the loop.
+class AsyncSubscription:
+    def __init__(self, game_id, maxsize, loop):
+        self.game_id = game_id
+        self.overflowed = False
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize)
+
+    def put(self, message):
+        try:
+            self._loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    def _put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout=None):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+# In-process fan-out of game updates to every subscriber of a game.
+# Publishing never blocks on slow subscribers.
+class GameBroker:
+    def __init__(self, queue_size=256):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, game_id, loop=None):
+        if loop is not None:
+            subscription = AsyncSubscription(game_id, self.queue_size, loop)
+        else:
+            subscription = Subscription(game_id, self.queue_size)
+        with self._lock:
+            self._subscribers[game_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.game_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.game_id]
+
+    def publish(self, game_id, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(game_id, ()))
+            self.published += 1
+        for subscription in subscribers:
+            subscription.put(message)
+        return len(subscribers)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'games': len(self._subscribers),
+                'subscribers': sum(len(s) for s in self._subscribers.values()),
+                'published': self.published,
+            }
@@ -0,0 +1,152 @@
+
+import threading
+import time
+from collections import OrderedDict
+
+
+# Thread-safe, bounded LRU cache with optional expiry. Entries expire either
+# after the cache-wide ttl (seconds) or at an explicit expires_at timestamp
+# (epoch seconds) given to set(), whichever the caller chooses.
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires_at=None):
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class _Load:
+    __slots__ = ('done', 'value', 'error', 'stale')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.stale = False
+
+
+# LRUCache in front of load(key). Concurrent misses for the same key share
+# one load (single flight): the first caller runs it, the others wait for
+# its result. invalidate() also marks a load in progress as stale, so a
+# value read before a change is returned to its waiters but never cached.
+# Only values for which cacheable(value) is true are stored.
+class ReadThroughCache:
+    def __init__(self, load, maxsize=1024, ttl=None, cacheable=None):
+        self.load = load
+        self.cacheable = cacheable
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._loads = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.coalesced = 0
+
+    # Cached value only, without loading
+    def peek(self, key):
+        return self.cache.get(key)
+
+    def get(self, key):
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            pending = self._loads.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._loads[key] = _Load()
+                self.loads += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            pending.value = value = self.load(key)
+        except BaseException as e:
+            pending.error = e
+            raise
+        else:
+            # Under the lock, so an invalidate() cannot slip in between the
+            # stale check and the store
+            with self._lock:
+                if value is not None and not pending.stale and (self.cacheable is None or self.cacheable(value)):
+                    self.cache.set(key, value)
+        finally:
+            with self._lock:
+                if self._loads.get(key) is pending:
+                    del self._loads[key]
+            pending.done.set()
+
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            pending = self._loads.pop(key, None)
+            if pending is not None:
+                pending.stale = True
+            self.cache.invalidate(key)
+
+    def stats(self):
+        stats = self.cache.stats()
+        with self._lock:
+            stats.update(loads=self.loads, coalesced=self.coalesced, loading=len(self._loads))
+        return stats
@@ -0,0 +1,204 @@
+
+import json
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+# Encodings of the games.data column.
+#
+# Rows written before codecs existed hold plain JSON text and are still read
+# as such. Every other encoding is stored as a BLOB whose first byte says how
+# the rest is encoded, so rows in different encodings can live side by side
+# and old rows keep loading whatever the configured codec is.
+
+JSON = 0x01         # compact JSON
+JSON_ZLIB = 0x02    # zlib-compressed compact JSON
+BINARY = 0x03       # compact tagged binary encoding (below)
+BINARY_ZLIB = 0x04  # zlib-compressed binary encoding
+BINARY_ZSTD = 0x05  # zstd-compressed binary encoding (needs zstandard)
+
+CODECS = {
+    'text': None,
+    'json': JSON,
+    'json+zlib': JSON_ZLIB,
+    'binary': BINARY,
+    'binary+zlib': BINARY_ZLIB,
+    'binary+zstd': BINARY_ZSTD,
+}
+
+
+class CodecError(ValueError):
+    pass
+
+
+# Binary encoding: one tag byte per value, varint lengths, and a table of
+# strings already seen so repeated keys and values ('position',
+# 'collected_particles', 'sector_a', ...) cost one or two bytes each.
+
+def _write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _pack(value, out, strings):
+    if value is None:
+        out.append(0x4e)  # N
+    elif value is True:
+        out.append(0x54)  # T
+    elif value is False:
+        out.append(0x46)  # F
+    elif isinstance(value, int):
+        out.append(0x69)  # i, zigzag varint
+        _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+    elif isinstance(value, float):
+        out.append(0x64)  # d
+        out += struct.pack('<d', value)
+    elif isinstance(value, str):
+        index = strings.get(value)
+        if index is not None:
+            out.append(0x72)  # r, reference to an earlier string
+            _write_varint(out, index)
+        else:
+            strings[value] = len(strings)
+            raw = value.encode('utf-8')
+            out.append(0x73)  # s
+            _write_varint(out, len(raw))
+            out += raw
+    elif isinstance(value, (list, tuple)):
+        out.append(0x6c)  # l
+        _write_varint(out, len(value))
+        for item in value:
+            _pack(item, out, strings)
+    elif isinstance(value, dict):
+        out.append(0x6d)  # m
+        _write_varint(out, len(value))
+        for key, item in value.items():
+            _pack(str(key), out, strings)
+            _pack(item, out, strings)
+    else:
+        raise CodecError('Cannot encode %r' % type(value))
+
+
+def _unpack(data, pos, strings):
+    tag = data[pos]
+    pos += 1
+    if tag == 0x4e:
+        return None, pos
+    if tag == 0x54:
+        return True, pos
+    if tag == 0x46:
+        return False, pos
+    if tag == 0x69:
+        n, pos = _read_varint(data, pos)
+        return (n >> 1) if not n & 1 else -((n + 1) >> 1), pos
+    if tag == 0x64:
+        return struct.unpack_from('<d', data, pos)[0], pos + 8
+    if tag == 0x73:
+        length, pos = _read_varint(data, pos)
+        value = data[pos:pos + length].decode('utf-8')
+        strings.append(value)
+        return value, pos + length
+    if tag == 0x72:
+        index, pos = _read_varint(data, pos)
+        return strings[index], pos
+    if tag == 0x6c:
+        count, pos = _read_varint(data, pos)
+        items = []
+        for _ in range(count):
+            item, pos = _unpack(data, pos, strings)
+            items.append(item)
+        return items, pos
+    if tag == 0x6d:
+        count, pos = _read_varint(data, pos)
+        result = {}
+        for _ in range(count):
+            key, pos = _unpack(data, pos, strings)
+            result[key], pos = _unpack(data, pos, strings)
+        return result, pos
+    raise CodecError('Unknown tag 0x%02x at offset %d' % (tag, pos - 1))
+
+
+def pack(value):
+    out = bytearray()
+    _pack(value, out, {})
+    return bytes(out)
+
+
+def unpack(data):
+    value, _ = _unpack(data, 0, [])
+    return value
+
+
+def _compact_json(value):
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def encode(value, codec='text'):
+    if codec not in CODECS:
+        raise CodecError('Unknown codec %r' % codec)
+
+    header = CODECS[codec]
+    if header is None:
+        return json.dumps(value)
+    if header == JSON:
+        body = _compact_json(value)
+    elif header == JSON_ZLIB:
+        body = zlib.compress(_compact_json(value), 6)
+    elif header == BINARY:
+        body = pack(value)
+    elif header == BINARY_ZLIB:
+        body = zlib.compress(pack(value), 6)
+    else:
+        if zstandard is None:
+            raise CodecError('The binary+zstd codec needs the zstandard package')
+        body = zstandard.ZstdCompressor(level=6).compress(pack(value))
+    return bytes([header]) + body
+
+
+def decode(raw):
+    # Legacy rows: plain JSON text
+    if isinstance(raw, str):
+        return json.loads(raw)
+
+    header, body = raw[0], memoryview(raw)[1:]
+    if header == JSON:
+        return json.loads(bytes(body))
+    if header == JSON_ZLIB:
+        return json.loads(zlib.decompress(body))
+    if header == BINARY:
+        return unpack(bytes(body))
+    if header == BINARY_ZLIB:
+        return unpack(zlib.decompress(body))
+    if header == BINARY_ZSTD:
+        if zstandard is None:
+            raise CodecError('Row is zstd-compressed but zstandard is not installed')
+        return unpack(zstandard.ZstdDecompressor().decompress(bytes(body)))
+    raise CodecError('Unknown codec header 0x%02x' % header)
+
+
+# Name of the codec a stored value was written with
+def codec_of(raw):
+    if isinstance(raw, str):
+        return 'text'
+    for name, header in CODECS.items():
+        if header == raw[0]:
+            return name
+    raise CodecError('Unknown codec header 0x%02x' % raw[0])
@@ -0,0 +1,186 @@
+
+import queue
+import sqlite3
+import threading
+import time
+
+# Default database file
+DATABASE = 'database.db'
+
+# Pragmas applied once to every new connection. WAL lets readers keep going
+# while a writer commits, so get_games/get_game are not blocked by make_move.
+# auto_vacuum only takes effect on a new, empty file (before WAL is set) and
+# lets archive.compact release free pages without rewriting the database.
+CONNECTION_PRAGMAS = (
+    'PRAGMA auto_vacuum = INCREMENTAL',
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA cache_size = -16000',      # ~16 MB page cache per connection
+    'PRAGMA mmap_size = 134217728',    # 128 MB memory-mapped I/O
+    'PRAGMA temp_store = MEMORY',
+)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# Connection handed out by the pool. It behaves like a sqlite3.Connection,
+# except that close() gives the underlying connection back to the pool.
+# Nothing else does: callers must close it on every path, including errors.
+class PooledConnection:
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed database.')
+        return getattr(self._conn, name)
+
+    def execute(self, sql, parameters=()):
+        return self._run('execute', sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run('executemany', sql, seq_of_parameters)
+
+    def _run(self, method, sql, parameters):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed database.')
+        func = getattr(self._conn, method)
+        observer = self._pool.observer
+        if observer is None:
+            return func(sql, parameters)
+        return observer(func, sql, parameters)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+        return False
+
+    @property
+    def closed(self):
+        return self._conn is None
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+
+# Bounded pool of long-lived SQLite connections. Idle connections are kept
+# in a LIFO queue so a busy worker thread keeps getting the same warm
+# connection (and its page cache) back.
+class ConnectionPool:
+    def __init__(self, database=DATABASE, max_size=8, timeout=10.0):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._in_use = 0
+        self._acquires = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+        self._timeouts = 0
+        # Callables run on every new connection, e.g. to install tracing
+        self.connect_hooks = []
+        # Optional observer(func, sql, parameters) wrapped around every
+        # statement run through a PooledConnection, e.g. to time it
+        self.observer = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=5.0, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        for hook in self.connect_hooks:
+            hook(conn)
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                grow = self._size < self.max_size
+                if grow:
+                    self._size += 1
+            if grow:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                    raise
+            else:
+                # Pool exhausted, wait for another request to release one
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeout('Timed out waiting for a database connection')
+                finally:
+                    waited = time.perf_counter() - started
+                    with self._lock:
+                        self._waits += 1
+                        self._wait_time += waited
+                        self._max_wait = max(self._max_wait, waited)
+
+        with self._lock:
+            self._acquires += 1
+            self._in_use += 1
+        return conn
+
+    def release(self, conn):
+        with self._lock:
+            self._in_use -= 1
+        try:
+            # Never hand out a connection with a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            with self._lock:
+                self._size -= 1
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    def connection(self):
+        return PooledConnection(self, self.acquire())
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._size -= 1
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self._size,
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'acquires': self._acquires,
+                'waits': self._waits,
+                'wait_time_total': self._wait_time,
+                'wait_time_max': self._max_wait,
+                'wait_time_avg': self._wait_time / self._waits if self._waits else 0.0,
+                'timeouts': self._timeouts,
+            }
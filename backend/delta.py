@@ -0,0 +1,74 @@
+
+import copy
+
+# JSON-patch style diffs (RFC 6902 subset: add, remove, replace) between two
+# game-state documents. Paths are JSON pointers, e.g. "/players/0/position".
+
+
+def _escape(key):
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def _unescape(token):
+    return token.replace('~1', '/').replace('~0', '~')
+
+
+def diff(old, new, path=''):
+    ops = []
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                ops.append({'op': 'remove', 'path': path + '/' + _escape(key)})
+        for key, value in new.items():
+            child = path + '/' + _escape(key)
+            if key not in old:
+                ops.append({'op': 'add', 'path': child, 'value': value})
+            else:
+                ops.extend(diff(old[key], value, child))
+
+    elif isinstance(old, list) and isinstance(new, list):
+        common = min(len(old), len(new))
+        for i in range(common):
+            ops.extend(diff(old[i], new[i], path + '/' + str(i)))
+        for i in range(common, len(new)):
+            ops.append({'op': 'add', 'path': path + '/' + str(i), 'value': new[i]})
+        # Remove from the end so earlier indexes stay valid
+        for i in range(len(old) - 1, common - 1, -1):
+            ops.append({'op': 'remove', 'path': path + '/' + str(i)})
+
+    elif type(old) is not type(new) or old != new:
+        ops.append({'op': 'replace', 'path': path, 'value': new})
+
+    return ops
+
+
+def apply_patch(doc, ops):
+    doc = copy.deepcopy(doc)
+
+    for op in ops:
+        if op['path'] == '':
+            doc = copy.deepcopy(op.get('value'))
+            continue
+
+        tokens = [_unescape(t) for t in op['path'].split('/')[1:]]
+        parent = doc
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+
+        last = tokens[-1]
+        if isinstance(parent, list):
+            index = len(parent) if last == '-' else int(last)
+            if op['op'] == 'add':
+                parent.insert(index, copy.deepcopy(op['value']))
+            elif op['op'] == 'remove':
+                del parent[index]
+            else:
+                parent[index] = copy.deepcopy(op['value'])
+        else:
+            if op['op'] == 'remove':
+                del parent[last]
+            else:
+                parent[last] = copy.deepcopy(op['value'])
+
+    return doc
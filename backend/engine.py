@@ -0,0 +1,287 @@
+
+import datetime
+import logging
+import threading
+import time
+from collections import deque
+
+from models import GameState
+
+logger = logging.getLogger(__name__)
+
+
+class GameNotLive(Exception):
+    pass
+
+
+# In-memory state of one game in progress, as a typed GameState. The state
+# is only touched with the lock held; use snapshot() for a plain dict copy.
+class LiveGame:
+    def __init__(self, game_id, state, version, next_seq, meta, history):
+        self.game_id = game_id
+        self.state = state
+        self.version = version
+        self.persisted_version = version
+        self.next_seq = next_seq
+        self.meta = meta
+        self.updated_at = meta.get('updated_at')
+        self.pending_events = []
+        self.pending_deltas = []
+        self.pending_snapshots = []
+        self.recent_deltas = deque(maxlen=history)
+        self.evicted = False
+        self.last_access = time.monotonic()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+    @property
+    def dirty(self):
+        return bool(self.pending_deltas)
+
+    # games.data document of the current state. Call with the lock held.
+    def snapshot(self):
+        return self.state.to_dict()
+
+    # Combined patch from since_version to the current version, or None if
+    # the history no longer reaches back that far. Call with the lock held.
+    def patch_since(self, since_version):
+        if since_version == self.version:
+            return []
+        deltas = [d for d in self.recent_deltas if d[0] > since_version]
+        if len(deltas) != self.version - since_version:
+            return None
+        patch = []
+        for _, delta in deltas:
+            patch.extend(delta)
+        return patch
+
+
+# Authoritative in-memory owner of games in progress. Rules run against the
+# live state under a per-game lock; changes reach SQLite by write-behind.
+#
+#   load(game_id)              -> dict(state, version, next_seq, meta,
+#                                 deltas) or None
+#   persist(game_id, snapshot) -> False if the stored version moved on
+#   (snapshot['snapshots'] lists (seq, state) pairs: the full state after
+#   every snapshot_interval-th event, for replays)
+#   on_update(game_id, events, version, patch, status) runs under the game
+#   lock, so subscribers see updates in version order.
+#
+# Dirty games are flushed at most flush_interval seconds after a change, and
+# synchronously when a game completes or the engine stops. flush_interval=0
+# writes through on every update. The engine assumes this process is the
+# only writer of the games it holds, which is why the app is deployed as a
+# single process (wsgi.py); a flush that finds a newer stored version drops
+# the live copy, and the moves it had accepted, and reloads it on next
+# access.
+class GameEngine:
+    def __init__(self, load, persist, on_update=None, flush_interval=1.0,
+                 idle_timeout=300.0, history=100, snapshot_interval=0):
+        self.load = load
+        self.persist = persist
+        self.on_update = on_update
+        self.flush_interval = flush_interval
+        self.idle_timeout = idle_timeout
+        self.history = history
+        self.snapshot_interval = snapshot_interval
+        self._games = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.loads = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.conflicts = 0
+        self.evictions = 0
+
+    def _start_flusher(self):
+        if self.flush_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='game-flusher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            now = time.monotonic()
+            with self._lock:
+                games = list(self._games.values())
+            for live in games:
+                try:
+                    if live.dirty:
+                        self._flush_game(live)
+                    elif now - live.last_access > self.idle_timeout:
+                        self._evict(live)
+                except Exception:
+                    logger.exception('Flushing game %s failed', live.game_id)
+
+    def get(self, game_id):
+        with self._lock:
+            live = self._games.get(game_id)
+        if live is not None:
+            live.last_access = time.monotonic()
+            return live
+
+        loaded = self.load(game_id)
+        if loaded is None:
+            return None
+
+        live = LiveGame(game_id, GameState.from_dict(loaded['state']), loaded['version'],
+                        loaded['next_seq'], loaded['meta'], self.history)
+        live.recent_deltas.extend(loaded.get('deltas', ()))
+        with self._lock:
+            self._start_flusher()
+            existing = self._games.get(game_id)
+            if existing is not None:
+                return existing
+            self._games[game_id] = live
+            self.loads += 1
+        return live
+
+    # Run mutate(state) on the live GameState. mutate returns the list of
+    # events it produced; if it raises, its changes are rolled back. The
+    # patch comes from the operations the state recorded, so no document is
+    # copied or diffed. Returns (version, patch, events, state), where state
+    # is a dict snapshot, or None unless want_state is set.
+    def update(self, game_id, mutate, want_state=True):
+        for _ in range(3):
+            live = self.get(game_id)
+            if live is None:
+                raise GameNotLive(game_id)
+
+            with live.lock:
+                if live.evicted:
+                    continue
+
+                state = live.state
+                state.begin()
+                try:
+                    events = mutate(state)
+                except Exception:
+                    state.rollback()
+                    raise
+
+                patch = state.commit()
+                live.version += 1
+                live.updated_at = datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+                for event in events:
+                    event['seq'] = live.next_seq
+                    live.next_seq += 1
+                live.pending_events.extend(events)
+                live.pending_deltas.append((live.version, patch))
+                if self.snapshot_due(events):
+                    live.pending_snapshots.append((events[-1]['seq'], live.snapshot()))
+                live.recent_deltas.append((live.version, patch))
+                version = live.version
+                status = state.status
+                snapshot = live.snapshot() if want_state else None
+
+                if self.on_update is not None:
+                    self.on_update(game_id, events, version, patch, status)
+
+            # Completed games are persisted right away and leave memory
+            if status == 'completed':
+                self._flush_game(live)
+                self._evict(live)
+            elif self.flush_interval <= 0:
+                self._flush_game(live)
+
+            return version, patch, events, snapshot
+
+        raise GameNotLive(game_id)
+
+    # Whether newly appended events crossed a multiple of snapshot_interval.
+    # Also used for the events of games not (yet) in the engine.
+    def snapshot_due(self, events):
+        if not self.snapshot_interval or not events:
+            return False
+        return (events[0]['seq'] - 1) // self.snapshot_interval != events[-1]['seq'] // self.snapshot_interval
+
+    def _flush_game(self, live):
+        with live.flush_lock:
+            with live.lock:
+                if not live.dirty:
+                    return True
+                snapshot = {
+                    'state': live.snapshot(),
+                    'status': live.state.status,
+                    'version': live.version,
+                    'base_version': live.persisted_version,
+                    'updated_at': live.updated_at,
+                    'events': live.pending_events,
+                    'deltas': live.pending_deltas,
+                    'snapshots': live.pending_snapshots,
+                }
+                live.pending_events = []
+                live.pending_deltas = []
+                live.pending_snapshots = []
+
+            try:
+                persisted = self.persist(live.game_id, snapshot)
+            except Exception:
+                # Keep the changes queued for the next attempt
+                with live.lock:
+                    live.pending_events = snapshot['events'] + live.pending_events
+                    live.pending_deltas = snapshot['deltas'] + live.pending_deltas
+                    live.pending_snapshots = snapshot['snapshots'] + live.pending_snapshots
+                with self._lock:
+                    self.flush_failures += 1
+                raise
+
+            if not persisted:
+                logger.warning('Game %s was changed outside the engine; dropping %d unflushed versions',
+                               live.game_id, len(snapshot['deltas']))
+                with self._lock:
+                    self.conflicts += 1
+                self._evict(live, flush=False)
+                return False
+
+            with live.lock:
+                live.persisted_version = snapshot['version']
+            with self._lock:
+                self.flushes += 1
+            return True
+
+    def _evict(self, live, flush=True):
+        while True:
+            if flush and live.dirty:
+                self._flush_game(live)
+            with live.lock:
+                # An update acknowledged while the flush ran must be
+                # persisted too before the game leaves memory
+                if flush and live.dirty:
+                    continue
+                live.evicted = True
+            break
+        with self._lock:
+            if self._games.get(live.game_id) is live:
+                del self._games[live.game_id]
+                self.evictions += 1
+
+    # Persist one game (or all games) now
+    def flush(self, game_id=None):
+        with self._lock:
+            if game_id is None:
+                games = list(self._games.values())
+            else:
+                games = [self._games[game_id]] if game_id in self._games else []
+        for live in games:
+            self._flush_game(live)
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'games': len(self._games),
+                'dirty': sum(1 for live in self._games.values() if live.dirty),
+                'loads': self.loads,
+                'flushes': self.flushes,
+                'flush_failures': self.flush_failures,
+                'conflicts': self.conflicts,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,120 @@
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+# Hash with a werkzeug method ('scrypt', 'pbkdf2:sha256:600000', ...), or
+# werkzeug's own default method and cost if None, so upgrading werkzeug
+# never leaves new hashes weaker than the library recommends
+def hash_password(password, method=None):
+    if method is None:
+        return generate_password_hash(password)
+    return generate_password_hash(password, method)
+
+
+# Method and cost prefix of a stored hash, e.g. 'scrypt:32768:8:1'
+def hash_method(password_hash):
+    return password_hash.split('$', 1)[0]
+
+
+class HasherBusy(Exception):
+    pass
+
+
+# Runs password hashing and verification on a dedicated process pool so
+# key derivation never runs on (and starves) the request threads. At most
+# max_pending operations may be queued or running; beyond that requests are
+# rejected with HasherBusy straight away instead of piling up.
+# With workers=0 hashing runs inline, which is handy for tests.
+class PasswordHasher:
+    def __init__(self, method=None, workers=None, max_pending=None, timeout=10.0):
+        self.method = method
+        self._reference_method = None
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+        self.max_pending = max_pending or max(self.workers, 1) * 4
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def _get_executor(self):
+        # Created lazily so importing the app never forks
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy()
+
+        if self.workers == 0:
+            try:
+                result = fn(*args)
+            finally:
+                self._slots.release()
+        else:
+            try:
+                future = self._get_executor().submit(fn, *args)
+            except Exception:
+                self._slots.release()
+                raise
+            # The slot is held until the work is really done, even if the
+            # caller stops waiting for it
+            future.add_done_callback(lambda f: self._slots.release())
+            try:
+                result = future.result(timeout=self.timeout)
+            except TimeoutError:
+                raise HasherBusy()
+
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    # True if the stored hash was made with another method or cost than a
+    # new one would be. werkzeug stores the method with all its parameters
+    # ('scrypt' becomes 'scrypt:32768:8:1'), so the comparison is with the
+    # prefix of a reference hash, made once on the pool. May raise
+    # HasherBusy the first time.
+    def needs_rehash(self, password_hash):
+        if self._reference_method is None:
+            self._reference_method = hash_method(self._run(hash_password, '', self.method))
+        return hash_method(password_hash) != self._reference_method
+
+    # New hash for a password whose stored hash is outdated
+    def rehash(self, password):
+        password_hash = self.hash(password)
+        with self._lock:
+            self.rehashed += 1
+        return password_hash
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'rehashed': self.rehashed,
+            }
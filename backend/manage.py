@@ -0,0 +1,173 @@
+
+import argparse
+import os
+import sys
+import time
+
+import codec
+import migrations
+from archive import Archiver, GameArchive, compact as compact_database
+from database import ConnectionPool, DATABASE
+
+
+# Create or upgrade the schema. Run once before starting the server workers
+# instead of letting every worker race to run DDL at boot.
+def init_db(args):
+    from app import create_app, init_db
+
+    app = create_app({'DATABASE': args.database})
+    started = time.perf_counter()
+    with app.app_context():
+        init_db()
+    app.extensions['entanglion'].close()
+    print('Initialized %s in %.3fs' % (args.database, time.perf_counter() - started))
+
+
+# Apply the pending schema migrations, or with --dry-run print their SQL
+def migrate(args):
+    pool = ConnectionPool(args.database, max_size=1)
+    conn = pool.connection()
+
+    version = migrations.current_version(conn)
+    pending = migrations.pending(conn)
+    if args.dry_run:
+        print('-- Schema version %d, %d migration(s) pending' % (version, len(pending)))
+        migrations.print_sql(pending)
+    else:
+        log = lambda message: print(message, file=sys.stderr)  # noqa: E731
+        applied = migrations.migrate(conn, batch_size=args.batch_size, log=log)
+        print('Schema version %d -> %d (%d migration(s) applied)'
+              % (version, migrations.current_version(conn), len(applied)))
+
+    conn.close()
+    pool.close_all()
+
+
+# Re-encode games.data with another codec, a batch of rows per transaction
+# so the game service can keep running. Rows changed concurrently (their
+# version moved on) are skipped; run the command again to pick them up.
+def reencode(args):
+    pool = ConnectionPool(args.database, max_size=1)
+    conn = pool.connection()
+
+    last_id = 0
+    scanned = changed = skipped = 0
+    bytes_before = bytes_after = 0
+
+    while True:
+        query = 'SELECT id, version, data FROM games WHERE id > ?'
+        params = [last_id]
+        if args.status:
+            query += ' AND status = ?'
+            params.append(args.status)
+        query += ' ORDER BY id LIMIT ?'
+        params.append(args.batch_size)
+
+        rows = conn.execute(query, params).fetchall()
+        if not rows:
+            break
+
+        for row in rows:
+            scanned += 1
+            if codec.codec_of(row['data']) == args.codec:
+                continue
+
+            data = codec.encode(codec.decode(row['data']), args.codec)
+            cursor = conn.execute('UPDATE games SET data = ? WHERE id = ? AND version = ?',
+                                  (data, row['id'], row['version']))
+            if cursor.rowcount != 1:
+                skipped += 1
+                continue
+
+            changed += 1
+            bytes_before += len(row['data'])
+            bytes_after += len(data)
+
+        conn.commit()
+        last_id = rows[-1]['id']
+        print('... %d rows scanned, %d re-encoded' % (scanned, changed), file=sys.stderr)
+
+    conn.close()
+    pool.close_all()
+
+    print('Scanned %d rows, re-encoded %d, skipped %d (changed concurrently)' % (scanned, changed, skipped))
+    if changed:
+        print('Re-encoded rows: %d bytes -> %d bytes (%.1f%%)'
+              % (bytes_before, bytes_after, 100.0 * bytes_after / bytes_before))
+
+
+# Move completed games not changed for --older-than seconds to the archive
+# database, then compact the main one
+def archive(args):
+    pool = ConnectionPool(args.database, max_size=1)
+    game_archive = GameArchive(args.archive or os.path.splitext(args.database)[0] + '-archive.db')
+    archiver = Archiver(pool, game_archive, archive_after=args.older_than, batch_size=args.batch_size)
+
+    result = archiver.run_once()
+    stats = archiver.stats()
+
+    game_archive.pool.close_all()
+    pool.close_all()
+
+    print('Archived %d games (%d bytes moved, %d skipped as changed concurrently)'
+          % (result['archived'], stats['bytes_moved'], stats['skipped']))
+    print('Released %d bytes' % result['bytes_reclaimed'])
+
+
+# Release free pages of the main database. --full rebuilds the file with
+# VACUUM, which also switches databases created before incremental
+# auto-vacuum to it; it needs as much free disk as the database takes.
+def compact(args):
+    pool = ConnectionPool(args.database, max_size=1)
+    conn = pool.connection()
+
+    if args.full:
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        before = conn.execute('PRAGMA page_count').fetchone()[0]
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        after = conn.execute('PRAGMA page_count').fetchone()[0]
+        print('Rebuilt %s: %d bytes -> %d bytes' % (args.database, before * page_size, after * page_size))
+    else:
+        print('Released %d bytes' % compact_database(conn))
+
+    conn.close()
+    pool.close_all()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Entanglion backend management commands')
+    parser.add_argument('--database', default=DATABASE, help='SQLite database file')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('init-db', help='Create or upgrade the database schema')
+    command.set_defaults(func=init_db)
+
+    command = commands.add_parser('migrate', help='Apply pending schema migrations')
+    command.add_argument('--dry-run', action='store_true', help='Print the SQL instead of running it')
+    command.add_argument('--batch-size', type=int, default=500, help='Rows per backfill transaction')
+    command.set_defaults(func=migrate)
+
+    command = commands.add_parser('reencode', help='Re-encode games.data with another codec')
+    command.add_argument('--codec', required=True, choices=sorted(codec.CODECS))
+    command.add_argument('--status', help='Only re-encode games with this status, e.g. completed')
+    command.add_argument('--batch-size', type=int, default=500)
+    command.set_defaults(func=reencode)
+
+    command = commands.add_parser('archive', help='Move old completed games to the archive database')
+    command.add_argument('--archive', help='Archive database file (default: <database>-archive.db)')
+    command.add_argument('--older-than', type=float, default=7 * 86400,
+                         help='Archive games completed at least this many seconds ago')
+    command.add_argument('--batch-size', type=int, default=100, help='Games per transaction')
+    command.set_defaults(func=archive)
+
+    command = commands.add_parser('compact', help='Release free pages of the database')
+    command.add_argument('--full', action='store_true', help='Rebuild the whole file with VACUUM')
+    command.set_defaults(func=compact)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
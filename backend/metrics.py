@@ -0,0 +1,195 @@
+
+import random
+import sqlite3
+import threading
+import time
+
+from flask import Response, g, request
+
+# Prometheus-style metrics: counters and histograms kept in memory and
+# rendered in the text exposition format at GET /metrics, plus gauges read
+# from the stats() of the pool, caches, engine and so on at scrape time.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{%s}' % ','.join('%s="%s"' % (name, value) for (name, _), value in zip(pairs, escaped))
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s counter' % self.name]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append('%s%s %s' % (self.name, _format_labels(self.labels, labels), _format_value(value)))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s histogram' % self.name]
+        with self._lock:
+            for labels, series in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append('%s_bucket%s %d' % (
+                        self.name, _format_labels(self.labels, labels, ('le', _format_value(bound))), cumulative))
+                label_text = _format_labels(self.labels, labels)
+                lines.append('%s_sum%s %s' % (self.name, label_text, _format_value(series[-2])))
+                lines.append('%s_count%s %d' % (self.name, label_text, series[-1]))
+        return lines
+
+
+class Metrics:
+    def __init__(self, prefix='entanglion', sample_rate=1.0):
+        self.prefix = prefix
+        self.sample_rate = sample_rate
+        self._metrics = []
+        self._stats = []
+        self._local = threading.local()
+
+        self.requests = self.counter('http_requests_total', 'HTTP requests by endpoint and status', ('endpoint', 'status'))
+        self.request_latency = self.histogram(
+            'http_request_duration_seconds', 'Latency of sampled requests by endpoint', ('endpoint',))
+        self.statements = self.counter(
+            'sql_statements_total', 'SQL statements run by sampled requests', ('endpoint', 'verb'))
+        self.statement_latency = self.histogram(
+            'sql_statement_duration_seconds', 'Duration of sampled SQL statements, including busy waits', ('verb',))
+        self.busy_errors = self.counter(
+            'sql_busy_errors_total', 'Statements that failed because the database was locked', ('endpoint',))
+        self.game_data_size = self.histogram(
+            'game_data_bytes', 'Size of encoded games.data values written', ('codec',), SIZE_BUCKETS)
+
+    def counter(self, name, help, labels=()):
+        metric = Counter('%s_%s' % (self.prefix, name), help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram('%s_%s' % (self.prefix, name), help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    # Expose every numeric value of stats() as <prefix>_<name>_<key>
+    def add_stats(self, name, stats):
+        self._stats.append((name, stats))
+
+    def sampled(self):
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def init_app(self, app):
+        @app.before_request
+        def start_timer():
+            self._local.endpoint = request.endpoint or 'unknown'
+            self._local.sampled = self.sampled()
+            g.metrics_started = time.perf_counter()
+
+        @app.after_request
+        def record_request(response):
+            endpoint = request.endpoint or 'unknown'
+            self.requests.inc(endpoint, str(response.status_code))
+            if getattr(self._local, 'sampled', False):
+                self.request_latency.observe(time.perf_counter() - g.metrics_started, endpoint)
+            return response
+
+        @app.teardown_request
+        def clear_request(exc):
+            self._local.endpoint = None
+            self._local.sampled = False
+
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def instrument_pool(self, pool):
+        pool.observer = self.observe_statement
+
+    def observe_statement(self, func, sql, parameters):
+        endpoint = getattr(self._local, 'endpoint', None)
+        if endpoint is None:
+            # Background work (engine flushes) is not tied to a request
+            endpoint = 'background'
+            sampled = self.sampled()
+        else:
+            sampled = self._local.sampled
+
+        if not sampled:
+            return func(sql, parameters)
+
+        verb = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else 'EMPTY'
+        started = time.perf_counter()
+        try:
+            return func(sql, parameters)
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e) or 'busy' in str(e):
+                self.busy_errors.inc(endpoint)
+            raise
+        finally:
+            self.statement_latency.observe(time.perf_counter() - started, verb)
+            self.statements.inc(endpoint, verb)
+
+    def observe_game_data(self, value, codec_name):
+        if self.sampled():
+            self.game_data_size.observe(len(value.encode('utf-8') if isinstance(value, str) else value), codec_name)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, stats in self._stats:
+            for key, value in sorted(stats().items()):
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                metric = '%s_%s_%s' % (self.prefix, name, key)
+                lines.append('# TYPE %s untyped' % metric)
+                lines.append('%s %s' % (metric, _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,435 @@
+
+import json
+import sys
+import textwrap
+
+import codec
+import stats
+
+# Numbered schema migrations. The versions applied to a database are
+# recorded in schema_version; `python manage.py migrate` applies the missing
+# ones in order.
+#
+# Databases created before migrations existed have no schema_version table
+# but already hold some of the schema, so the early migrations only create
+# what is missing (IF NOT EXISTS, AddColumn).
+#
+# Schema changes of a migration run in one transaction. Data changes on
+# large tables go in a separate migration with a Backfill, which works
+# through the table in small batches, one transaction each, so the game
+# service can keep running; it must be safe to resume after an
+# interruption.
+
+
+class SQL:
+    def __init__(self, statement):
+        self.statement = textwrap.dedent(statement).strip()
+
+    def describe(self):
+        return [self.statement + ';']
+
+    def run(self, conn):
+        conn.execute(self.statement)
+
+
+# ALTER TABLE ... ADD COLUMN, skipped if the column already exists
+class AddColumn:
+    def __init__(self, table, column, definition):
+        self.table = table
+        self.column = column
+        self.definition = definition
+
+    def describe(self):
+        return ['ALTER TABLE %s ADD COLUMN %s %s;' % (self.table, self.column, self.definition)]
+
+    def run(self, conn):
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(%s)' % self.table)]
+        if self.column not in columns:
+            conn.execute('ALTER TABLE %s ADD COLUMN %s %s' % (self.table, self.column, self.definition))
+
+
+# Batched data migration. select takes (last_key, limit) and returns rows
+# ordered by their first column; update(conn, row) is called for each row.
+class Backfill:
+    def __init__(self, select, update):
+        self.select = textwrap.dedent(select).strip()
+        self.update = update
+
+    def describe(self):
+        return ['-- in batches, per row: %s' % self.update.__name__, self.select + ';']
+
+    def run(self, conn, batch_size=500, log=None):
+        last_key = 0
+        total = 0
+        while True:
+            # Take the write lock before reading so concurrent runners
+            # cannot process the same rows
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(self.select, (last_key, batch_size)).fetchall()
+            if not rows:
+                conn.rollback()
+                break
+            try:
+                for row in rows:
+                    self.update(conn, row)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            last_key = rows[-1][0]
+            total += len(rows)
+            if log:
+                log('... %d rows' % total)
+        return total
+
+
+# A migration has either schema steps or a backfill, not both
+class Migration:
+    def __init__(self, version, name, steps=(), backfill=None):
+        self.version = version
+        self.name = name
+        self.steps = steps
+        self.backfill = backfill
+
+
+# Move the events still embedded in games.data into the event log
+def move_legacy_events(conn, row):
+    game_data = codec.decode(row['data'])
+    events = game_data.pop('events', None)
+    if events is None:
+        return
+
+    seq = conn.execute('''
+        SELECT COALESCE(MAX(seq), 0) AS seq FROM game_events WHERE game_id = ?
+    ''', (row['id'],)).fetchone()['seq']
+    for event in events:
+        seq += 1
+        event.pop('seq', None)
+        conn.execute('''
+            INSERT INTO game_events (game_id, seq, type, data)
+            VALUES (?, ?, ?, ?)
+        ''', (row['id'], seq, event['type'], json.dumps(event)))
+
+    conn.execute('UPDATE games SET data = ? WHERE id = ?',
+                 (codec.encode(game_data, codec.codec_of(row['data'])), row['id']))
+
+
+ROLES = ['quantum_operator', 'navigation_engineer', 'particle_collector', 'quantum_physicist']
+
+
+# Seat counters of the games that are still open to players
+def count_seats(conn, row):
+    game_data = codec.decode(row['data'])
+    roles = [member['role'] for member in conn.execute('SELECT role FROM user_games WHERE game_id = ?', (row['id'],))]
+    roles_taken = 0
+    for role in roles:
+        if role in ROLES:
+            roles_taken |= 1 << ROLES.index(role)
+
+    conn.execute('''
+        UPDATE games SET seats_taken = ?, max_players = ?, roles_taken = ? WHERE id = ?
+    ''', (len(roles), game_data.get('player_count', 4), roles_taken, row['id']))
+
+
+# Copy a game's updated_at to its memberships
+def copy_game_updated_at(conn, row):
+    conn.execute('UPDATE user_games SET game_updated_at = ? WHERE game_id = ?', (row['updated_at'], row['id']))
+
+
+# Snapshot of each game's current state at its latest event, so replays of
+# games older than the snapshots can start from there
+def snapshot_current_state(conn, row):
+    seq = conn.execute('''
+        SELECT COALESCE(MAX(seq), 0) AS seq FROM game_events WHERE game_id = ?
+    ''', (row['id'],)).fetchone()['seq']
+    conn.execute('''
+        INSERT OR IGNORE INTO game_snapshots (game_id, seq, data)
+        VALUES (?, ?, ?)
+    ''', (row['id'], seq, row['data']))
+
+
+MIGRATIONS = [
+    Migration(1, 'users, games and memberships', [
+        SQL('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        '''),
+        SQL('''
+        CREATE TABLE IF NOT EXISTS games (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_by INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (created_by) REFERENCES users (id)
+        )
+        '''),
+        SQL('''
+        CREATE TABLE IF NOT EXISTS user_games (
+            user_id INTEGER NOT NULL,
+            game_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, game_id),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (game_id) REFERENCES games (id)
+        )
+        '''),
+    ]),
+    Migration(2, 'append-only game event log', [
+        SQL('''
+        CREATE TABLE IF NOT EXISTS game_events (
+            game_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (game_id, seq),
+            FOREIGN KEY (game_id) REFERENCES games (id)
+        ) WITHOUT ROWID
+        '''),
+    ]),
+    Migration(3, 'game state versions and patches', [
+        AddColumn('games', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+        SQL('''
+        CREATE TABLE IF NOT EXISTS game_deltas (
+            game_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            patch TEXT NOT NULL,
+            PRIMARY KEY (game_id, version),
+            FOREIGN KEY (game_id) REFERENCES games (id)
+        ) WITHOUT ROWID
+        '''),
+    ]),
+    # A user's memberships (covering the game listing), a game's players,
+    # and games by status and recency
+    Migration(4, 'secondary indexes', [
+        SQL('CREATE INDEX IF NOT EXISTS idx_user_games_user ON user_games (user_id, game_id, role)'),
+        SQL('CREATE INDEX IF NOT EXISTS idx_user_games_game ON user_games (game_id)'),
+        SQL('CREATE INDEX IF NOT EXISTS idx_games_status_updated ON games (status, updated_at, id)'),
+    ]),
+    Migration(5, 'move legacy events out of games.data', backfill=Backfill('''
+        SELECT id, data FROM games
+        WHERE id > ? AND data LIKE '%"events"%'
+        ORDER BY id
+        LIMIT ?
+    ''', move_legacy_events)),
+    # Seats of open games for the lobby; roles_taken is a bitmask over ROLES.
+    # The partial index holds only the games that can still be joined.
+    Migration(6, 'lobby seat counters', [
+        AddColumn('games', 'seats_taken', 'INTEGER NOT NULL DEFAULT 0'),
+        AddColumn('games', 'max_players', 'INTEGER NOT NULL DEFAULT 4'),
+        AddColumn('games', 'roles_taken', 'INTEGER NOT NULL DEFAULT 0'),
+        SQL('''
+        CREATE INDEX IF NOT EXISTS idx_games_open
+        ON games (seats_taken DESC, id)
+        WHERE status IN ('waiting', 'ready') AND seats_taken < max_players
+        '''),
+    ]),
+    Migration(7, 'count seats of open games', backfill=Backfill('''
+        SELECT id, data FROM games
+        WHERE id > ? AND status IN ('waiting', 'ready')
+        ORDER BY id
+        LIMIT ?
+    ''', count_seats)),
+    # Completed games whose state and events were moved to the archive
+    Migration(8, 'archived games', [
+        AddColumn('games', 'archived_at', 'TIMESTAMP'),
+    ]),
+    # Full game state after event seq, every SNAPSHOT_INTERVAL events (seq 0
+    # is the state the game was created with)
+    Migration(9, 'game state snapshots', [
+        SQL('''
+        CREATE TABLE IF NOT EXISTS game_snapshots (
+            game_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (game_id, seq),
+            FOREIGN KEY (game_id) REFERENCES games (id)
+        ) WITHOUT ROWID
+        '''),
+    ]),
+    Migration(10, 'snapshot existing games', backfill=Backfill('''
+        SELECT id, data FROM games
+        WHERE id > ? AND archived_at IS NULL
+        ORDER BY id
+        LIMIT ?
+    ''', snapshot_current_state)),
+    # Tokens revoked before their expiry (see revocation.py); expires_at and
+    # revoked_at are epoch seconds
+    Migration(11, 'revoked tokens', [
+        SQL('''
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            jti TEXT PRIMARY KEY,
+            expires_at INTEGER,
+            revoked_at REAL NOT NULL
+        ) WITHOUT ROWID
+        '''),
+        SQL('CREATE INDEX IF NOT EXISTS idx_revoked_tokens_revoked ON revoked_tokens (revoked_at)'),
+    ]),
+    # Per-player counters kept up to date from the event log (stats.py), the
+    # leaderboard index over them, and achievements: a user_stats column and
+    # the value that unlocks each one
+    Migration(12, 'player statistics and achievements', [
+        SQL('''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            games_played INTEGER NOT NULL DEFAULT 0,
+            games_won INTEGER NOT NULL DEFAULT 0,
+            particles_collected INTEGER NOT NULL DEFAULT 0,
+            quantum_gates_used INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        '''),
+        SQL('''
+        CREATE INDEX IF NOT EXISTS idx_user_stats_leaderboard
+        ON user_stats (games_won DESC, particles_collected DESC, user_id)
+        '''),
+        SQL('''
+        CREATE TABLE IF NOT EXISTS achievements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            stat TEXT NOT NULL,
+            threshold INTEGER NOT NULL
+        )
+        '''),
+        SQL('''
+        CREATE TABLE IF NOT EXISTS user_achievements (
+            user_id INTEGER NOT NULL,
+            achievement_id INTEGER NOT NULL,
+            unlocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, achievement_id),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (achievement_id) REFERENCES achievements (id)
+        ) WITHOUT ROWID
+        '''),
+        SQL('''
+        INSERT OR IGNORE INTO achievements (id, name, description, stat, threshold) VALUES
+            (1, 'First Particle', 'Collect your first quantum particle', 'particles_collected', 1),
+            (2, 'Particle Physicist', 'Collect 25 quantum particles', 'particles_collected', 25),
+            (3, 'Gatekeeper', 'Use 10 quantum gates', 'quantum_gates_used', 10),
+            (4, 'Entangled', 'Finish your first game', 'games_played', 1),
+            (5, 'Veteran', 'Finish 25 games', 'games_played', 25),
+            (6, 'First Victory', 'Win a game', 'games_won', 1),
+            (7, 'Quantum Champion', 'Win 10 games', 'games_won', 10)
+        '''),
+    ]),
+    Migration(13, 'count player statistics', backfill=Backfill('''
+        SELECT id FROM users
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', stats.recount_user)),
+    # The game listing pages through a user's games by recency. With the
+    # game's updated_at copied to user_games (and kept there by triggers),
+    # idx_user_games_recent returns them in order, so a page reads only its
+    # own rows instead of sorting all of the user's games.
+    Migration(14, 'membership recency for the game listing', [
+        AddColumn('user_games', 'game_updated_at', 'TIMESTAMP'),
+        SQL('''
+        CREATE INDEX IF NOT EXISTS idx_user_games_recent
+        ON user_games (user_id, game_updated_at, game_id, role)
+        '''),
+        SQL('''
+        CREATE TRIGGER IF NOT EXISTS user_games_joined AFTER INSERT ON user_games
+        BEGIN
+            UPDATE user_games
+            SET game_updated_at = (SELECT updated_at FROM games WHERE id = NEW.game_id)
+            WHERE user_id = NEW.user_id AND game_id = NEW.game_id;
+        END
+        '''),
+        SQL('''
+        CREATE TRIGGER IF NOT EXISTS games_updated AFTER UPDATE OF updated_at ON games
+        WHEN NEW.updated_at IS NOT OLD.updated_at
+        BEGIN
+            UPDATE user_games SET game_updated_at = NEW.updated_at WHERE game_id = NEW.id;
+        END
+        '''),
+    ]),
+    Migration(15, 'copy game recency to memberships', backfill=Backfill('''
+        SELECT id, updated_at FROM games
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', copy_game_updated_at)),
+]
+
+
+def create_version_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+
+# Highest applied migration; 0 for a new or pre-migrations database
+def current_version(conn):
+    exists = conn.execute('''
+        SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'
+    ''').fetchone()
+    if not exists:
+        return 0
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def pending(conn):
+    version = current_version(conn)
+    return [migration for migration in MIGRATIONS if migration.version > version]
+
+
+def print_sql(migrations, out=sys.stdout):
+    for migration in migrations:
+        print('-- %04d %s' % (migration.version, migration.name), file=out)
+        for step in migration.steps:
+            for line in step.describe():
+                print(line, file=out)
+        if migration.backfill:
+            for line in migration.backfill.describe():
+                print(line, file=out)
+        print("INSERT INTO schema_version (version, name) VALUES (%d, '%s');"
+              % (migration.version, migration.name.replace("'", "''")), file=out)
+        print(file=out)
+
+
+# Apply the pending migrations in order and return them. Several processes
+# may run this at once: each migration takes the write lock and re-checks
+# the version before running its schema steps.
+def migrate(conn, batch_size=500, log=None):
+    create_version_table(conn)
+    applied = []
+    for migration in pending(conn):
+        if migration.backfill:
+            if log:
+                log('Backfilling %04d %s' % (migration.version, migration.name))
+            migration.backfill.run(conn, batch_size, log)
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if current_version(conn) >= migration.version:
+                conn.rollback()
+                continue
+            for step in migration.steps:
+                step.run(conn)
+            conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)',
+                         (migration.version, migration.name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        applied.append(migration)
+        if log:
+            log('Applied %04d %s' % (migration.version, migration.name))
+    return applied
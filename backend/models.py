@@ -0,0 +1,255 @@
+
+import datetime
+
+# Typed in-memory game state. GameState.from_dict()/to_dict() read and write
+# the same JSON document stored in games.data.
+#
+# Mutations go through GameState methods, which keep the lookup indexes
+# (player by id, particles by position) up to date and record the
+# JSON-patch operations they make, so callers get the delta of a change
+# without diffing whole documents. Between begin() and commit()/rollback()
+# every mutation can also be undone.
+
+
+def utcnow():
+    return datetime.datetime.utcnow().isoformat()
+
+
+class Particle:
+    __slots__ = ('id', 'type', 'position')
+
+    def __init__(self, id, type, position):
+        self.id = id
+        self.type = type
+        self.position = position
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['type'], data['position'])
+
+    def to_dict(self):
+        return {'id': self.id, 'type': self.type, 'position': self.position}
+
+
+class Player:
+    __slots__ = ('id', 'name', 'role', 'position', 'collected_particles')
+
+    def __init__(self, id, name, role, position='start', collected_particles=None):
+        self.id = id
+        self.name = name
+        self.role = role
+        self.position = position
+        self.collected_particles = collected_particles if collected_particles is not None else []
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['name'], data['role'], data.get('position', 'start'),
+                   [Particle.from_dict(p) for p in data.get('collected_particles', [])])
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'role': self.role,
+            'position': self.position,
+            'collected_particles': [p.to_dict() for p in self.collected_particles]
+        }
+
+
+class Event:
+    __slots__ = ('type', 'timestamp', 'seq', 'data')
+
+    def __init__(self, type, timestamp=None, seq=None, **data):
+        self.type = type
+        self.timestamp = timestamp or utcnow()
+        self.seq = seq
+        self.data = data
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        return cls(data.pop('type'), data.pop('timestamp', None), data.pop('seq', None), **data)
+
+    def to_dict(self):
+        event = {'type': self.type, 'timestamp': self.timestamp}
+        event.update(self.data)
+        if self.seq is not None:
+            event['seq'] = self.seq
+        return event
+
+
+class GameState:
+    __slots__ = ('board', 'player_count', 'current_turn', 'players', 'particles', 'extra',
+                 '_players_by_id', '_particles_by_position', '_ops', '_undo')
+
+    # Top-level keys with a typed attribute; anything else (status,
+    # started_at, winner, ...) is kept as-is in extra
+    FIELDS = ('board', 'player_count', 'current_turn', 'players', 'quantum_particles')
+
+    def __init__(self, board, player_count, current_turn, players, particles, extra=None):
+        self.board = board
+        self.player_count = player_count
+        self.current_turn = current_turn
+        self.players = players
+        self.particles = particles
+        self.extra = extra if extra is not None else {}
+        self._ops = []
+        self._undo = []
+        self._reindex()
+
+    def _reindex(self):
+        self._players_by_id = {player.id: index for index, player in enumerate(self.players)}
+        self._particles_by_position = {}
+        for particle in self.particles:
+            self._particles_by_position.setdefault(particle.position, []).append(particle)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data.get('board'),
+            data.get('player_count'),
+            data.get('current_turn', 0),
+            [Player.from_dict(p) for p in data.get('players', [])],
+            [Particle.from_dict(p) for p in data.get('quantum_particles', [])],
+            {key: value for key, value in data.items() if key not in cls.FIELDS}
+        )
+
+    def to_dict(self):
+        data = {
+            'board': self.board,
+            'player_count': self.player_count,
+            'current_turn': self.current_turn,
+            'players': [player.to_dict() for player in self.players],
+            'quantum_particles': [particle.to_dict() for particle in self.particles]
+        }
+        data.update(self.extra)
+        return data
+
+    # Lookups
+
+    @property
+    def status(self):
+        return self.extra.get('status')
+
+    def player(self, player_id):
+        index = self._players_by_id.get(player_id)
+        return self.players[index] if index is not None else None
+
+    def particle_at(self, position):
+        particles = self._particles_by_position.get(position)
+        return particles[0] if particles else None
+
+    def current_player(self):
+        return self.players[self.current_turn] if self.players else None
+
+    def is_won(self):
+        # Only worth scanning players once every particle is collected
+        if self.particles:
+            return False
+        return any(player.position == 'start' and player.collected_particles for player in self.players)
+
+    # Change tracking
+
+    def begin(self):
+        self._ops = []
+        self._undo = []
+
+    def commit(self):
+        ops = self._ops
+        self._ops = []
+        self._undo = []
+        return ops
+
+    def rollback(self):
+        for undo in reversed(self._undo):
+            undo()
+        self._ops = []
+        self._undo = []
+        self._reindex()
+
+    # Mutations
+
+    def move_player(self, player, position):
+        index = self._players_by_id[player.id]
+        previous = player.position
+        player.position = position
+        self._ops.append({'op': 'replace', 'path': '/players/%d/position' % index, 'value': position})
+        self._undo.append(lambda: setattr(player, 'position', previous))
+
+    def collect_particle(self, player, particle):
+        player_index = self._players_by_id[player.id]
+        particle_index = self.particles.index(particle)
+
+        del self.particles[particle_index]
+        at_position = self._particles_by_position[particle.position]
+        at_position.remove(particle)
+        if not at_position:
+            del self._particles_by_position[particle.position]
+        player.collected_particles.append(particle)
+
+        self._ops.append({'op': 'remove', 'path': '/quantum_particles/%d' % particle_index})
+        self._ops.append({
+            'op': 'add',
+            'path': '/players/%d/collected_particles/%d' % (player_index, len(player.collected_particles) - 1),
+            'value': particle.to_dict()
+        })
+
+        def undo():
+            player.collected_particles.pop()
+            self.particles.insert(particle_index, particle)
+        self._undo.append(undo)
+
+    def advance_turn(self):
+        previous = self.current_turn
+        self.current_turn = (self.current_turn + 1) % len(self.players)
+        self._ops.append({'op': 'replace', 'path': '/current_turn', 'value': self.current_turn})
+        self._undo.append(lambda: setattr(self, 'current_turn', previous))
+
+    def add_player(self, player):
+        self.players.append(player)
+        self._players_by_id[player.id] = len(self.players) - 1
+        self._ops.append({'op': 'add', 'path': '/players/%d' % (len(self.players) - 1), 'value': player.to_dict()})
+        self._undo.append(self.players.pop)
+
+    def set(self, key, value):
+        existed = key in self.extra
+        previous = self.extra.get(key)
+        self.extra[key] = value
+        self._ops.append({'op': 'replace' if existed else 'add', 'path': '/' + key, 'value': value})
+
+        def undo():
+            if existed:
+                self.extra[key] = previous
+            else:
+                del self.extra[key]
+        self._undo.append(undo)
+
+    # Replay
+
+    # Apply a logged event (a dict from game_events) to the state. Each event
+    # type records one of the changes above, so a snapshot plus the events
+    # after it rebuild any later state; other event types change nothing.
+    def apply_event(self, event):
+        kind = event['type']
+        if kind == 'player_joined':
+            self.add_player(Player.from_dict(event['player']))
+            if event.get('status'):
+                self.set('status', event['status'])
+        elif kind == 'game_start':
+            self.set('status', 'in_progress')
+            self.set('started_at', event['timestamp'])
+        elif kind == 'player_moved':
+            player = self.player(event['player_id'])
+            if player is not None:
+                self.move_player(player, event['position'])
+        elif kind == 'particle_collected':
+            player = self.player(event['player_id'])
+            particle = self.particle_at(event['position'])
+            if player is not None and particle is not None:
+                self.collect_particle(player, particle)
+        elif kind == 'turn_ended':
+            self.advance_turn()
+        elif kind == 'game_completed':
+            self.set('status', 'completed')
+            self.set('winner', event['winner_id'])
+            self.set('completed_at', event['timestamp'])
@@ -0,0 +1,115 @@
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# Per-key token buckets. Each named limit ("<count>/<s|m|h>") allows bursts
+# of up to count requests and refills at count per period; routes without a
+# limit of their own share the 'default' one.
+#
+# Buckets are kept in least-recently-used order. A bucket left alone for a
+# whole period is full again, which is the same as having none, so idle
+# buckets are dropped from the front as new requests come in and memory
+# stays proportional to the keys active within the longest period (and
+# never above max_keys).
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+
+DEFAULT_LIMITS = {
+    'default': '20/s',
+    'get_game': '10/s',
+    'login': '10/m',
+    'register': '5/m',
+}
+
+
+class RateLimit:
+    __slots__ = ('count', 'period', 'rate')
+
+    def __init__(self, count, period):
+        self.count = count
+        self.period = period
+        self.rate = count / period
+
+    @classmethod
+    def parse(cls, spec):
+        try:
+            count, unit = spec.strip().split('/')
+            return cls(int(count), PERIODS[unit.strip()])
+        except (KeyError, ValueError):
+            raise ValueError('Invalid rate limit %r, expected e.g. 10/s, 30/m or 100/h' % spec)
+
+
+# Limits from "name=count/unit,..." (e.g. RATE_LIMITS="get_game=5/s,login=3/m")
+# over DEFAULT_LIMITS
+def parse_limits(spec=''):
+    specs = dict(DEFAULT_LIMITS)
+    for item in (spec or '').split(','):
+        if item.strip():
+            name, _, value = item.partition('=')
+            specs[name.strip()] = value
+    return {name: RateLimit.parse(value) for name, value in specs.items()}
+
+
+class RateLimiter:
+    def __init__(self, limits, max_keys=100000):
+        self.limits = limits
+        self.max_keys = max_keys
+        self.idle_timeout = max([limit.period for limit in limits.values()], default=0)
+        self._buckets = OrderedDict()  # (limit name, key) -> [tokens, last update]
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+        self.evictions = 0
+
+    # Take a token for key on route. Returns 0 if the request may go ahead,
+    # else the seconds until a token is available.
+    def acquire(self, route, key):
+        name = route if route in self.limits else 'default'
+        limit = self.limits.get(name)
+        if limit is None:
+            return 0
+
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get((name, key))
+            if bucket is None:
+                bucket = self._buckets[(name, key)] = [limit.count, now]
+            else:
+                bucket[0] = min(limit.count, bucket[0] + (now - bucket[1]) * limit.rate)
+                bucket[1] = now
+                self._buckets.move_to_end((name, key))
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                self.allowed += 1
+                wait = 0
+            else:
+                self.rejected += 1
+                wait = (1 - bucket[0]) / limit.rate
+
+            self._evict(now)
+        return wait
+
+    def _evict(self, now):
+        buckets = self._buckets
+        while buckets:
+            key, (_, updated) = next(iter(buckets.items()))
+            if now - updated < self.idle_timeout and len(buckets) <= self.max_keys:
+                break
+            del buckets[key]
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'keys': len(self._buckets),
+                'allowed': self.allowed,
+                'rejected': self.rejected,
+                'evictions': self.evictions,
+            }
+
+
+def retry_after(wait):
+    return str(max(1, math.ceil(wait)))
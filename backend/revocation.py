@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a failed load of the revoked_tokens table is retried
+LOAD_RETRY_INTERVAL = 5.0
+
+
+# Revoked tokens (by jti) until their own expiry. The in-memory copy is
+# bucketed by exp: a lookup is one dict and one set membership test, with
+# no lock, and whole buckets are dropped once every token in them has
+# expired, so memory is bounded by the tokens revoked within one token
+# lifetime.
+#
+# The revoked_tokens table only makes revocations survive a restart: it is
+# read once, by the first lookup, and from then on every revocation goes
+# through revoke(), which updates the in-memory copy directly. The server
+# runs as a single process, so lookups never read the table again.
+class TokenDenylist:
+    def __init__(self, pool, bucket_seconds=3600):
+        self.pool = pool
+        self.bucket_seconds = bucket_seconds
+        self._buckets = {}  # exp // bucket_seconds -> set of jti
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._retry_at = 0.0
+        self.revocations = 0
+        self.load_failures = 0
+
+    def is_revoked(self, jti, exp):
+        if not self._loaded and time.monotonic() >= self._retry_at:
+            self.load()
+        if not self._buckets:
+            return False
+        bucket = self._buckets.get(exp // self.bucket_seconds if exp is not None else None)
+        return bucket is not None and jti in bucket
+
+    # Expired revocations are forgotten here rather than on lookups, in
+    # memory and in the table
+    def revoke(self, jti, exp):
+        now = time.time()
+        with self._lock:
+            self._add(jti, exp)
+            self.revocations += 1
+            expired = self._purge(now)
+
+        conn = self.pool.connection()
+        try:
+            conn.execute('''
+                INSERT OR IGNORE INTO revoked_tokens (jti, expires_at, revoked_at)
+                VALUES (?, ?, ?)
+            ''', (jti, exp, now))
+            if expired:
+                conn.execute('DELETE FROM revoked_tokens WHERE expires_at <= ?', (now,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _add(self, jti, exp):
+        key = exp // self.bucket_seconds if exp is not None else None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = set()
+        bucket.add(jti)
+
+    # Drop the buckets whose tokens have all expired; returns how many
+    def _purge(self, now):
+        current = now // self.bucket_seconds
+        expired = [key for key in self._buckets if key is not None and key < current]
+        for key in expired:
+            del self._buckets[key]
+        return len(expired)
+
+    # Load the revocations that have not expired yet and delete the rest.
+    # Lookups made meanwhile wait for it, so a token revoked before a
+    # restart is never accepted after it
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            now = time.time()
+            try:
+                conn = self.pool.connection()
+                try:
+                    rows = conn.execute('''
+                        SELECT jti, expires_at
+                        FROM revoked_tokens
+                        WHERE expires_at IS NULL OR expires_at > ?
+                    ''', (now,)).fetchall()
+                    conn.execute('DELETE FROM revoked_tokens WHERE expires_at <= ?', (now,))
+                    conn.commit()
+                finally:
+                    conn.close()
+            except Exception:
+                self.load_failures += 1
+                self._retry_at = time.monotonic() + LOAD_RETRY_INTERVAL
+                logger.exception('Loading revoked tokens failed')
+                return
+
+            for row in rows:
+                self._add(row['jti'], row['expires_at'])
+            self._loaded = True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': sum(len(bucket) for bucket in self._buckets.values()),
+                'buckets': len(self._buckets),
+                'revocations': self.revocations,
+                'loaded': self._loaded,
+                'load_failures': self.load_failures,
+            }
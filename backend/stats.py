@@ -0,0 +1,81 @@
+
+# Per-player statistics, kept up to date from the game event log: every
+# batch of events is counted into user_stats, and achievements unlocked, in
+# the transaction that inserts the events. Achievements are rows of the
+# achievements table: a statistic and the value that unlocks it.
+
+# user_stats counters by the event that increments them
+STATS = ('games_played', 'games_won', 'particles_collected', 'quantum_gates_used')
+
+# The CASE picking an achievement's statistic from a user_stats row (s)
+ACHIEVEMENT_STAT = 'CASE a.stat %s END' % ' '.join(
+    "WHEN '%s' THEN s.%s" % (stat, stat) for stat in STATS)
+
+
+def empty_stats():
+    return dict.fromkeys(STATS, 0)
+
+
+# Count events of a game into the stats of its players; callers commit
+def record_events(conn, game_id, events):
+    counts = {}
+
+    for event in events:
+        kind = event['type']
+        if kind == 'particle_collected':
+            counts.setdefault(event['player_id'], empty_stats())['particles_collected'] += 1
+        elif kind == 'quantum_gate_used':
+            counts.setdefault(event['player_id'], empty_stats())['quantum_gates_used'] += 1
+        elif kind == 'game_completed':
+            for row in conn.execute('SELECT user_id FROM user_games WHERE game_id = ?', (game_id,)):
+                counts.setdefault(row['user_id'], empty_stats())['games_played'] += 1
+            counts.setdefault(event['winner_id'], empty_stats())['games_won'] += 1
+
+    if not counts:
+        return
+
+    conn.executemany('''
+        INSERT INTO user_stats (user_id, %s, updated_at)
+        VALUES (?, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (user_id) DO UPDATE SET %s, updated_at = CURRENT_TIMESTAMP
+    ''' % (', '.join(STATS), ', '.join('?' for _ in STATS),
+           ', '.join('%s = %s + excluded.%s' % (stat, stat, stat) for stat in STATS)),
+        [(user_id,) + tuple(stats[stat] for stat in STATS) for user_id, stats in counts.items()])
+
+    unlock_achievements(conn, list(counts))
+
+
+def unlock_achievements(conn, user_ids):
+    conn.executemany('''
+        INSERT OR IGNORE INTO user_achievements (user_id, achievement_id)
+        SELECT s.user_id, a.id
+        FROM user_stats s, achievements a
+        WHERE s.user_id = ? AND %s >= a.threshold
+    ''' % ACHIEVEMENT_STAT, [(user_id,) for user_id in user_ids])
+
+
+# Count a user's stats from scratch from the event log (for the backfill;
+# events of archived games are no longer in the main database)
+def recount_user(conn, row):
+    user_id = row['id']
+    totals = conn.execute('''
+        SELECT
+            COUNT(DISTINCT CASE WHEN e.type = 'game_completed' THEN e.game_id END) AS games_played,
+            SUM(e.type = 'game_completed' AND json_extract(e.data, '$.winner_id') = ?) AS games_won,
+            SUM(e.type = 'particle_collected' AND json_extract(e.data, '$.player_id') = ?) AS particles_collected,
+            SUM(e.type = 'quantum_gate_used' AND json_extract(e.data, '$.player_id') = ?) AS quantum_gates_used
+        FROM user_games ug
+        JOIN game_events e ON e.game_id = ug.game_id
+        WHERE ug.user_id = ? AND e.type IN ('game_completed', 'particle_collected', 'quantum_gate_used')
+    ''', (user_id, user_id, user_id, user_id)).fetchone()
+
+    if not any(totals[stat] for stat in STATS):
+        return
+
+    conn.execute('''
+        INSERT OR REPLACE INTO user_stats (user_id, %s, updated_at)
+        VALUES (?, %s, CURRENT_TIMESTAMP)
+    ''' % (', '.join(STATS), ', '.join('?' for _ in STATS)),
+        (user_id,) + tuple(totals[stat] or 0 for stat in STATS))
+
+    unlock_achievements(conn, [user_id])
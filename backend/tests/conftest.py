@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+
+
+# App on a fresh database, with hashing inline and no background threads
+@pytest.fixture
+def make_app(tmp_path):
+    apps = []
+
+    def make(**config):
+        settings = {
+            'DATABASE': str(tmp_path / 'database.db'),
+            'SECRET_KEY': 'test-secret-key-of-at-least-32-bytes',
+            'HASH_WORKERS': 0,
+            'RATE_LIMITING': False,
+            'ARCHIVE_INTERVAL': 0,
+        }
+        settings.update(config)
+        app = app_module.create_app(settings)
+        with app.app_context():
+            app_module.init_db()
+        apps.append(app)
+        return app
+
+    yield make
+
+    for app in apps:
+        app.extensions['entanglion'].close()
+
+
+def register(client, name):
+    response = client.post('/api/register', json={'name': name, 'email': name + '@example.com', 'password': 'secret'})
+    assert response.status_code == 201
+    return {'Authorization': 'Bearer ' + response.get_json()['token']}
+
+
+# A started two-player game; returns (game id, creator headers, other headers)
+def started_game(client):
+    alice = register(client, 'alice')
+    bob = register(client, 'bob')
+    game_id = client.post('/api/games', json={'name': 'test'}, headers=alice).get_json()['game']['id']
+    assert client.post('/api/games/%d/join' % game_id, headers=bob).status_code == 200
+    assert client.post('/api/games/%d/start' % game_id, headers=alice).status_code == 200
+    return game_id, alice, bob
@@ -0,0 +1,61 @@
+import pytest
+
+from app import GameActionError, apply_action
+from conftest import started_game
+from models import GameState
+
+ALICE = {'id': 1, 'name': 'alice'}
+
+
+def game_state(status='in_progress'):
+    return GameState.from_dict({
+        'board': 'quantum_realm',
+        'player_count': 2,
+        'current_turn': 0,
+        'players': [
+            {'id': 1, 'name': 'alice', 'role': 'quantum_operator', 'position': 'start', 'collected_particles': []},
+            {'id': 2, 'name': 'bob', 'role': 'entanglement_specialist', 'position': 'start', 'collected_particles': []},
+        ],
+        'quantum_particles': [{'id': 1, 'type': 'photon', 'position': 'sector_a'}],
+        'status': status,
+    })
+
+
+def test_move_collects_the_particle_and_wins():
+    state = game_state()
+    events = apply_action(state, ALICE, 'move', 'sector_a')
+    events += apply_action(state, ALICE, 'move', 'start')
+    assert [event['type'] for event in events] == [
+        'player_moved', 'particle_collected', 'player_moved', 'game_completed']
+    assert state.status == 'completed'
+
+
+# A move that reaches a completed game before the engine evicts it must not
+# complete (and count) the game again
+def test_actions_on_a_completed_game_are_rejected():
+    state = game_state(status='completed')
+    with pytest.raises(GameActionError) as error:
+        apply_action(state, ALICE, 'move', 'start')
+    assert error.value.status == 409
+
+
+def test_unknown_actions_are_rejected_before_changing_anything():
+    state = game_state()
+    with pytest.raises(GameActionError) as error:
+        apply_action(state, ALICE, 'teleport', 'sector_a')
+    assert error.value.status == 400
+    assert state.player(1).position == 'start'
+
+
+def test_unknown_actions_do_not_create_a_version(make_app):
+    client = make_app().test_client()
+    game_id, alice, _ = started_game(client)
+    version = client.get('/api/games/%d' % game_id, headers=alice).get_json()['game']['version']
+
+    response = client.post('/api/games/%d/move' % game_id, json={'action': 'teleport'}, headers=alice)
+    assert response.status_code == 400
+    response = client.post('/api/games/%d/moves' % game_id, json={'actions': [{'action': 'teleport'}]}, headers=alice)
+    assert response.status_code == 400
+    assert response.get_json()['results'][0]['status'] == 400
+
+    assert client.get('/api/games/%d' % game_id, headers=alice).get_json()['game']['version'] == version
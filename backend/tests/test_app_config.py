@@ -0,0 +1,19 @@
+from conftest import started_game
+
+
+# Settings passed to create_app() apply to that app only
+def test_settings_are_per_app(make_app, tmp_path):
+    strict = make_app(MAX_BATCH_ACTIONS=1, SNAPSHOT_INTERVAL=7, DELTA_HISTORY=5)
+    default = make_app(DATABASE=str(tmp_path / 'other.db'))
+
+    engine = strict.extensions['entanglion'].game_engine
+    assert (engine.snapshot_interval, engine.history) == (7, 5)
+    engine = default.extensions['entanglion'].game_engine
+    assert (engine.snapshot_interval, engine.history) == (50, 100)
+
+    actions = {'actions': [{'action': 'move', 'target': 'sector_a'}, {'action': 'end_turn'}]}
+    for app, status in ((strict, 400), (default, 200)):
+        client = app.test_client()
+        game_id, alice, _ = started_game(client)
+        response = client.post('/api/games/%d/moves' % game_id, json=actions, headers=alice)
+        assert response.status_code == status
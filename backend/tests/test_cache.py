@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from cache import ReadThroughCache
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+# A cache whose loads block until release is set; returns (cache, calls,
+# release)
+def blocking_cache(value=lambda key: {'key': key}, **kwargs):
+    calls = []
+    release = threading.Event()
+
+    def load(key):
+        calls.append(key)
+        release.wait(5)
+        return value(key)
+
+    return ReadThroughCache(load, **kwargs), calls, release
+
+
+# Run cache.get(key) on n threads; returns (threads, results, errors)
+def concurrent_gets(cache, key, n):
+    results = []
+    errors = []
+
+    def get():
+        try:
+            results.append(cache.get(key))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=get) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_concurrent_misses_share_one_load():
+    cache, calls, release = blocking_cache()
+    threads, results, errors = concurrent_gets(cache, 7, 8)
+
+    wait_until(lambda: cache.stats()['coalesced'] == 7)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [7]
+    assert results == [{'key': 7}] * 8 and not errors
+    assert cache.peek(7) == {'key': 7}
+    assert cache.stats()['loading'] == 0
+
+
+def test_a_failed_load_is_raised_to_every_waiter():
+    def fail(key):
+        raise LookupError(key)
+
+    cache, calls, release = blocking_cache(fail)
+    threads, results, errors = concurrent_gets(cache, 7, 4)
+
+    wait_until(lambda: cache.stats()['coalesced'] == 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [7]
+    assert len(errors) == 4 and all(isinstance(error, LookupError) for error in errors)
+    assert cache.peek(7) is None
+
+
+# A value read before invalidate() reaches the callers already waiting for
+# it but is not cached, so the next get loads again
+def test_a_load_invalidated_while_running_is_not_cached():
+    cache, calls, release = blocking_cache()
+    threads, results, errors = concurrent_gets(cache, 7, 2)
+
+    wait_until(lambda: cache.stats()['coalesced'] == 1)
+    cache.invalidate(7)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [{'key': 7}] * 2
+    assert cache.peek(7) is None
+    assert cache.get(7) == {'key': 7}
+    assert calls == [7, 7]
+
+
+@pytest.mark.parametrize('status, cached', [('completed', True), ('in_progress', False)])
+def test_only_cacheable_values_are_stored(status, cached):
+    cache = ReadThroughCache(lambda key: {'status': status}, cacheable=lambda view: view['status'] != 'in_progress')
+    assert cache.get(1) == {'status': status}
+    assert (cache.peek(1) is not None) == cached
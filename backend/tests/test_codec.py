@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+import codec
+from conftest import started_game
+
+STATE = {
+    'board': 'quantum_realm',
+    'player_count': 2,
+    'current_turn': 0,
+    'players': [
+        {'id': 1, 'name': 'alice', 'role': 'quantum_operator', 'position': 'sector_a', 'collected_particles': []},
+        {'id': 2, 'name': 'Zoë ⚛', 'role': 'navigation_engineer', 'position': 'sector_a',
+         'collected_particles': [{'id': 1, 'type': 'photon'}]},
+    ],
+    'quantum_particles': [{'id': 2, 'type': 'electron', 'position': 'sector_b'}],
+    'scores': [0, -1, 2 ** 40, -2 ** 63, 0.5, -1e-9],
+    'winner': None,
+    'started': True,
+    'finished': False,
+    'status': 'in_progress',
+}
+
+AVAILABLE = [name for name in codec.CODECS if name != 'binary+zstd' or codec.zstandard is not None]
+
+
+@pytest.mark.parametrize('name', AVAILABLE)
+def test_values_round_trip(name):
+    raw = codec.encode(STATE, name)
+    assert codec.codec_of(raw) == name
+    assert codec.decode(raw) == STATE
+
+
+def test_binary_is_smaller_than_json():
+    assert len(codec.encode(STATE, 'binary')) < len(codec.encode(STATE, 'json'))
+
+
+def test_unknown_codecs_are_rejected():
+    with pytest.raises(codec.CodecError):
+        codec.encode(STATE, 'yaml')
+    with pytest.raises(codec.CodecError):
+        codec.decode(b'\x7f{}')
+    with pytest.raises(codec.CodecError):
+        codec.encode({'when': object()}, 'binary')
+
+
+# Games in play are written with GAME_DATA_CODEC and served decoded
+def test_games_are_stored_in_the_configured_codec(make_app):
+    app = make_app(GAME_DATA_CODEC='binary', COMPLETED_GAME_DATA_CODEC='json+zlib')
+    client = app.test_client()
+    game_id, _, bob = started_game(client)
+
+    conn = sqlite3.connect(app.config['DATABASE'])
+    raw = conn.execute('SELECT data FROM games WHERE id = ?', (game_id,)).fetchone()[0]
+    conn.close()
+
+    assert codec.codec_of(raw) == 'binary'
+    game = client.get('/api/games/%d' % game_id, headers=bob).get_json()['game']
+    assert game['data'] == codec.decode(raw)
+    assert [player['name'] for player in game['data']['players']] == ['alice', 'bob']
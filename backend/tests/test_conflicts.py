@@ -0,0 +1,88 @@
+import sqlite3
+
+import pytest
+
+import app as app_module
+from conftest import register
+
+
+def waiting_game(client):
+    alice = register(client, 'alice')
+    bob = register(client, 'bob')
+    game_id = client.post('/api/games', json={'name': 'test'}, headers=alice).get_json()['game']['id']
+    assert client.post('/api/games/%d/join' % game_id, headers=bob).status_code == 200
+    return game_id, alice
+
+
+def game_version(app, game_id):
+    conn = sqlite3.connect(app.config['DATABASE'])
+    try:
+        return conn.execute('SELECT version FROM games WHERE id = ?', (game_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+# Commit a newer version of the game from another connection before each of
+# the next `times` calls to save_game_state, as a concurrent request would
+def race_writes(app, monkeypatch, times):
+    save_game_state = app_module.save_game_state
+    calls = []
+
+    def racing(conn, game_id, *args, **kwargs):
+        calls.append(game_id)
+        if len(calls) <= times:
+            other = sqlite3.connect(app.config['DATABASE'])
+            other.execute('UPDATE games SET version = version + 1 WHERE id = ?', (game_id,))
+            other.commit()
+            other.close()
+        return save_game_state(conn, game_id, *args, **kwargs)
+
+    monkeypatch.setattr(app_module, 'save_game_state', racing)
+    return calls
+
+
+def test_save_game_state_rejects_a_stale_version(make_app):
+    app = make_app()
+    game_id, _ = waiting_game(app.test_client())
+    version = game_version(app, game_id)
+
+    with app.app_context():
+        conn = app_module.get_db_connection()
+        game = conn.execute('SELECT data FROM games WHERE id = ?', (game_id,)).fetchone()
+        game_data = app_module.decode_state(game['data'])
+        game_data['status'] = 'in_progress'
+        with pytest.raises(app_module.VersionConflict):
+            app_module.save_game_state(conn, game_id, game['data'], game_data, version - 1)
+
+    assert game_version(app, game_id) == version
+
+
+# The handler is re-run on a fresh read of the game and succeeds
+def test_a_conflicting_write_is_retried(make_app, monkeypatch):
+    app = make_app()
+    client = app.test_client()
+    game_id, alice = waiting_game(client)
+    version = game_version(app, game_id)
+    calls = race_writes(app, monkeypatch, times=1)
+
+    response = client.post('/api/games/%d/start' % game_id, headers=alice)
+
+    assert response.status_code == 200
+    assert response.get_json()['version'] == version + 2
+    assert len(calls) == 2
+    assert app.extensions['entanglion'].conflict_stats.stats() == {'conflicts': 1, 'retries': 1, 'exhausted': 0}
+
+
+def test_conflicts_past_the_retry_limit_are_reported(make_app, monkeypatch):
+    app = make_app(MAX_CONFLICT_RETRIES=2)
+    client = app.test_client()
+    game_id, alice = waiting_game(client)
+    calls = race_writes(app, monkeypatch, times=3)
+
+    response = client.post('/api/games/%d/start' % game_id, headers=alice)
+
+    assert response.status_code == 409
+    assert len(calls) == 3
+    assert app.extensions['entanglion'].conflict_stats.stats() == {'conflicts': 3, 'retries': 2, 'exhausted': 1}
+    status = client.get('/api/games/%d' % game_id, headers=alice).get_json()['game']['status']
+    assert status == 'ready'
@@ -0,0 +1,49 @@
+from engine import GameEngine
+
+
+def make_engine(persisted, on_persist=None):
+    def load(game_id):
+        return {
+            'state': {'players': [{'id': 1, 'name': 'alice', 'role': 'quantum_operator'}],
+                      'quantum_particles': [], 'status': 'in_progress'},
+            'version': 1,
+            'next_seq': 1,
+            'meta': {},
+        }
+
+    def persist(game_id, snapshot):
+        persisted.append(snapshot['version'])
+        if on_persist is not None:
+            on_persist()
+        return True
+
+    return GameEngine(load, persist, flush_interval=60)
+
+
+def move(target):
+    def mutate(state):
+        state.move_player(state.player(1), target)
+        return [{'type': 'player_moved', 'player_id': 1, 'position': target}]
+    return mutate
+
+
+# An update that lands while an eviction is flushing is persisted before
+# the game leaves memory
+def test_evict_persists_updates_made_during_its_flush():
+    persisted = []
+    moves = iter(['sector_b'])
+
+    def update_during_flush():
+        target = next(moves, None)
+        if target is not None:
+            engine.update(7, move(target), want_state=False)
+
+    engine = make_engine(persisted, update_during_flush)
+    engine.update(7, move('sector_a'), want_state=False)
+    live = engine.get(7)
+
+    engine._evict(live)
+
+    assert persisted == [2, 3]
+    assert live.evicted and not live.dirty
+    assert engine.stats()['games'] == 0
@@ -0,0 +1,40 @@
+import threading
+
+import app as app_module
+from conftest import started_game
+
+
+# Reads that flush the engine first must not hold a pooled connection while
+# the flush waits for one: with every connection held that way, no flush
+# could ever complete.
+def test_concurrent_reads_flush_without_exhausting_the_pool(make_app):
+    app = make_app(DB_POOL_SIZE=2, GAME_FLUSH_INTERVAL=60)
+    client = app.test_client()
+    game_id, alice, bob = started_game(client)
+
+    response = client.post('/api/games/%d/move' % game_id, json={'action': 'move', 'target': 'sector_a'}, headers=alice)
+    assert response.status_code == 200
+    with app.app_context():
+        assert app_module.game_engine.stats()['dirty'] == 1
+
+    paths = ['/api/games/%d/events' % game_id, '/api/games/%d/replay' % game_id] * 3
+    barrier = threading.Barrier(len(paths))
+    statuses = []
+
+    def read(path):
+        barrier.wait()
+        statuses.append(app.test_client().get(path, headers=bob).status_code)
+
+    threads = [threading.Thread(target=read, args=(path,)) for path in paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    assert statuses == [200] * len(paths)
+    with app.app_context():
+        assert app_module.db_pool.stats()['in_use'] == 0
+        assert app_module.game_engine.stats()['dirty'] == 0
+
+    events = client.get('/api/games/%d/events' % game_id, headers=bob).get_json()['events']
+    assert [event['type'] for event in events][-2:] == ['player_moved', 'particle_collected']
@@ -0,0 +1,21 @@
+from werkzeug.security import generate_password_hash
+
+from hashing import PasswordHasher
+
+
+def test_hash_made_with_the_configured_method_is_current():
+    for method in (None, 'scrypt', 'pbkdf2:sha256', 'pbkdf2:sha256:1000'):
+        hasher = PasswordHasher(method=method, workers=0)
+        assert not hasher.needs_rehash(hasher.hash('secret')), method
+
+
+def test_hash_with_another_method_or_cost_is_upgraded():
+    hasher = PasswordHasher(method='pbkdf2:sha256:2000', workers=0)
+    assert hasher.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:1000'))
+    assert hasher.needs_rehash(generate_password_hash('secret', 'scrypt'))
+
+
+def test_default_method_is_werkzeugs_own():
+    hasher = PasswordHasher(workers=0)
+    assert not hasher.needs_rehash(generate_password_hash('secret'))
+    assert hasher.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:260000'))
@@ -0,0 +1,80 @@
+import pytest
+
+import ratelimit
+from conftest import register
+from ratelimit import RateLimit, RateLimiter, parse_limits
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, 'monotonic', clock)
+    return clock
+
+
+def test_a_burst_is_allowed_then_limited_until_refilled(clock):
+    limiter = RateLimiter({'default': RateLimit(3, 1)})
+
+    assert [limiter.acquire('get_game', 'alice') for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire('get_game', 'alice') == pytest.approx(1 / 3)
+
+    clock.now += 1 / 3
+    assert limiter.acquire('get_game', 'alice') == 0
+    assert limiter.stats() == {'keys': 1, 'allowed': 4, 'rejected': 1, 'evictions': 0}
+
+
+def test_keys_and_routes_have_their_own_buckets(clock):
+    limiter = RateLimiter({'default': RateLimit(1, 1), 'login': RateLimit(1, 60)})
+
+    assert limiter.acquire('login', 'alice') == 0
+    assert limiter.acquire('login', 'alice') == pytest.approx(60)
+    assert limiter.acquire('login', 'bob') == 0
+    assert limiter.acquire('get_game', 'alice') == 0
+
+
+def test_routes_without_a_limit_are_not_limited(clock):
+    limiter = RateLimiter({'login': RateLimit(1, 60)})
+    assert [limiter.acquire('get_game', 'alice') for _ in range(100)] == [0] * 100
+
+
+# An idle bucket is full again after one period, so it is dropped
+def test_idle_buckets_are_evicted(clock):
+    limiter = RateLimiter({'default': RateLimit(1, 1), 'login': RateLimit(1, 60)}, max_keys=2)
+
+    limiter.acquire('login', 'alice')
+    clock.now += 60
+    limiter.acquire('get_game', 'bob')
+    assert limiter.stats()['keys'] == 1
+
+    limiter.acquire('get_game', 'carol')
+    limiter.acquire('get_game', 'dave')
+    assert limiter.stats() == {'keys': 2, 'allowed': 4, 'rejected': 0, 'evictions': 2}
+
+
+def test_limits_are_parsed_over_the_defaults():
+    limits = parse_limits('login=3/m, get_game=5/s')
+    assert (limits['login'].count, limits['login'].period) == (3, 60)
+    assert (limits['get_game'].count, limits['get_game'].period) == (5, 1)
+    assert limits['register'].count == 5
+
+    with pytest.raises(ValueError):
+        parse_limits('login=often')
+
+
+def test_limited_requests_get_429_with_retry_after(make_app):
+    client = make_app(RATE_LIMITING=True, RATE_LIMITS='login=2/m').test_client()
+    register(client, 'alice')
+    credentials = {'email': 'alice@example.com', 'password': 'secret'}
+
+    statuses = [client.post('/api/login', json=credentials).status_code for _ in range(3)]
+
+    assert statuses == [200, 200, 429]
+    assert int(client.post('/api/login', json=credentials).headers['Retry-After']) >= 1
@@ -0,0 +1,71 @@
+import time
+
+import revocation
+from conftest import register
+
+
+def logout(client, headers):
+    assert client.post('/api/logout', headers=headers).status_code == 200
+
+
+def test_a_logged_out_token_is_rejected(make_app):
+    app = make_app()
+    client = app.test_client()
+    alice = register(client, 'alice')
+    bob = register(client, 'bob')
+    assert client.get('/api/user', headers=alice).status_code == 200
+
+    logout(client, alice)
+
+    assert client.get('/api/user', headers=alice).status_code == 401
+    assert client.get('/api/user', headers=bob).status_code == 200
+    assert app.extensions['entanglion'].token_denylist.stats()['size'] == 1
+
+
+def test_revocations_survive_a_restart(make_app):
+    client = make_app().test_client()
+    alice = register(client, 'alice')
+    bob = register(client, 'bob')
+    logout(client, alice)
+
+    restarted = make_app().test_client()
+
+    assert restarted.get('/api/user', headers=alice).status_code == 401
+    assert restarted.get('/api/user', headers=bob).status_code == 200
+
+
+# Lookups after the first one never go back to the table, so a row
+# inserted behind the denylist's back is not seen
+def test_the_table_is_read_only_once(make_app):
+    app = make_app()
+    denylist = app.extensions['entanglion'].token_denylist
+    assert not denylist.is_revoked('a', None)
+
+    conn = app.extensions['entanglion'].db_pool.connection()
+    conn.execute('INSERT INTO revoked_tokens (jti, expires_at, revoked_at) VALUES (?, ?, ?)', ('b', None, time.time()))
+    conn.commit()
+    conn.close()
+
+    assert not denylist.is_revoked('b', None)
+    assert denylist.stats()['loaded']
+
+
+def test_expired_revocations_are_forgotten(make_app, monkeypatch):
+    app = make_app()
+    denylist = app.extensions['entanglion'].token_denylist
+    now = [time.time()]
+    monkeypatch.setattr(revocation.time, 'time', lambda: now[0])
+
+    exp = int(now[0]) + 60
+    denylist.revoke('old', exp)
+    assert denylist.is_revoked('old', exp)
+
+    now[0] += 2 * denylist.bucket_seconds
+    denylist.revoke('new', exp + 2 * denylist.bucket_seconds)
+
+    assert not denylist.is_revoked('old', exp)
+    assert denylist.stats()['buckets'] == 1
+    conn = app.extensions['entanglion'].db_pool.connection()
+    rows = [row['jti'] for row in conn.execute('SELECT jti FROM revoked_tokens')]
+    conn.close()
+    assert rows == ['new']
@@ -0,0 +1,60 @@
+import app as app_module
+from conftest import register
+
+
+def create_game(client, headers, player_count=2):
+    response = client.post('/api/games', json={'name': 'test', 'player_count': player_count}, headers=headers)
+    assert response.status_code == 201
+    return response.get_json()['game']['id']
+
+
+def read_game(game_id):
+    return app_module.get_db_connection().execute('SELECT * FROM games WHERE id = ?', (game_id,)).fetchone()
+
+
+def test_each_player_gets_the_next_free_role(make_app):
+    client = make_app().test_client()
+    alice = register(client, 'alice')
+    game_id = create_game(client, alice, player_count=3)
+
+    roles = [client.post('/api/games/%d/join' % game_id, headers=register(client, name)).get_json()['role']
+             for name in ('bob', 'carol')]
+
+    assert roles == app_module.ROLES[1:3]
+    response = client.post('/api/games/%d/join' % game_id, headers=register(client, 'dave'))
+    assert response.status_code == 409
+
+
+# A seat is claimed against the version of the game that was read: once
+# another join has committed, the claim fails instead of handing out the
+# same role twice, and the join is retried
+def test_a_claim_on_a_stale_read_fails(make_app):
+    app = make_app()
+    client = app.test_client()
+    alice = register(client, 'alice')
+    game_id = create_game(client, alice, player_count=3)
+
+    with app.app_context():
+        stale = read_game(game_id)
+    assert client.post('/api/games/%d/join' % game_id, headers=register(client, 'bob')).status_code == 200
+
+    with app.app_context():
+        conn = app_module.get_db_connection()
+        fresh = conn.execute('SELECT * FROM games WHERE id = ?', (game_id,)).fetchone()
+        assert app_module.claim_seat(conn, stale) is None
+        assert app_module.claim_seat(conn, fresh) == app_module.ROLES[2]
+        conn.rollback()
+
+
+def test_a_full_game_has_no_seat_to_claim(make_app):
+    app = make_app()
+    client = app.test_client()
+    alice = register(client, 'alice')
+    game_id = create_game(client, alice)
+    assert client.post('/api/games/%d/join' % game_id, headers=register(client, 'bob')).status_code == 200
+
+    with app.app_context():
+        game = read_game(game_id)
+        assert game['seats_taken'] == game['max_players']
+        conn = app_module.get_db_connection()
+        assert app_module.claim_seat(conn, game) is None
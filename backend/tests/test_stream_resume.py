@@ -0,0 +1,32 @@
+import app as app_module
+from conftest import started_game
+
+
+# Resuming a stream replays every missed event, however many batches that
+# takes, and then only events the replay did not cover
+def test_resume_replays_all_missed_events(make_app, monkeypatch):
+    monkeypatch.setattr(app_module, 'STREAM_REPLAY_BATCH', 2)
+    app = make_app(GAME_FLUSH_INTERVAL=0)
+    client = app.test_client()
+    game_id, alice, bob = started_game(client)
+
+    for target in ('sector_x', 'sector_y', 'sector_z'):
+        response = client.post('/api/games/%d/move' % game_id, json={'action': 'move', 'target': target}, headers=alice)
+        assert response.status_code == 200
+
+    events = client.get('/api/games/%d/events' % game_id, headers=bob).get_json()['events']
+    last_seq = events[-1]['seq']
+    assert last_seq > 2 * app_module.STREAM_REPLAY_BATCH
+
+    with app.test_request_context():
+        user = {'id': 1, 'name': 'alice'}
+        stream, error = app_module.open_game_stream(user, game_id, '1')
+        assert error is None
+        try:
+            opening = ''.join(stream.opening())
+        finally:
+            stream.close()
+
+    ids = [int(line[4:]) for line in opening.splitlines() if line.startswith('id: ')]
+    assert ids == list(range(2, last_seq + 1))
+    assert stream.format({'event': 'game_event', 'id': last_seq, 'data': {}}) is None
@@ -0,0 +1,14 @@
+# WSGI entry point for production servers, e.g.
+#
+#   python manage.py init-db
+#   gunicorn -w 1 --threads 16 wsgi:app
+#
+# Run one worker process and scale with threads: games in progress are held
+# in memory by the game engine of a single process (see engine.py). A second
+# worker would keep its own copy of a game, serve it stale and accept moves
+# that are later thrown away. Password hashing already runs on its own
+# process pool, so one worker still uses every core for logins.
+
+from app import create_app
+
+app = create_app()
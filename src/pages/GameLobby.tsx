@@ -7,7 +7,7 @@ import { Input } from "@/components/ui/input";
 import { Label } from "@/components/ui/label";
 import { toast } from "sonner";
 import { motion } from "framer-motion";
-import { useQuery, useMutation, useQueryClient } from "@tanstack/react-query";
+import { useInfiniteQuery, useMutation, useQueryClient } from "@tanstack/react-query";
 
 interface Game {
   id: number;
@@ -36,13 +36,21 @@ const GameLobby = () => {
     setToken(storedToken);
   }, [navigate]);
 
-  // Fetch user's games
-  const { data: gamesData, isLoading, error } = useQuery({
+  // Fetch user's games a page at a time; "Load more" follows next_cursor
+  const {
+    data: gamesData,
+    isLoading,
+    error,
+    fetchNextPage,
+    hasNextPage,
+    isFetchingNextPage,
+  } = useInfiniteQuery({
     queryKey: ["games"],
-    queryFn: async () => {
-      if (!token) return null;
+    queryFn: async ({ pageParam }) => {
+      const params = new URLSearchParams({ limit: "20" });
+      if (pageParam) params.set("cursor", pageParam);
       
-      const response = await fetch("http://localhost:5000/api/games", {
+      const response = await fetch(`http://localhost:5000/api/games?${params}`, {
         headers: {
           Authorization: `Bearer ${token}`,
         },
@@ -55,8 +63,12 @@ const GameLobby = () => {
       
       return response.json();
     },
+    initialPageParam: null as string | null,
+    getNextPageParam: (lastPage) => lastPage.next_cursor,
     enabled: !!token,
   });
+  
+  const games: Game[] = gamesData?.pages.flatMap((page) => page.games) ?? [];
 
   // Create new game mutation
   const createGameMutation = useMutation({
@@ -179,13 +191,14 @@ const GameLobby = () => {
                 <div className="text-center py-12 text-red-400">
                   Error loading games: {error instanceof Error ? error.message : "Unknown error"}
                 </div>
-              ) : !gamesData || gamesData.games.length === 0 ? (
+              ) : games.length === 0 ? (
                 <div className="text-center py-12 text-gray-400">
                   You don't have any games yet. Create one to get started!
                 </div>
               ) : (
+                <>
                 <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
-                  {gamesData.games.map((game: Game) => (
+                  {games.map((game: Game) => (
                     <Card key={game.id} className="bg-white/10 hover:bg-white/15 transition-colors">
                       <CardHeader className="pb-2">
                         <CardTitle className="text-lg">{game.name}</CardTitle>
@@ -222,6 +235,18 @@ const GameLobby = () => {
                     </Card>
                   ))}
                 </div>
+                {hasNextPage && (
+                  <div className="text-center mt-6">
+                    <Button
+                      variant="outline"
+                      onClick={() => fetchNextPage()}
+                      disabled={isFetchingNextPage}
+                    >
+                      {isFetchingNextPage ? "Loading..." : "Load more"}
+                    </Button>
+                  </div>
+                )}
+                </>
               )}
             </CardContent>
           </Card>
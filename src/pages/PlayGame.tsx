@@ -48,6 +48,40 @@ const PlayGame = () => {
     enabled: !!token && !!gameId,
   });
 
+  // Fetch the game event log, page by page. The log is append-only, so a
+  // refetch keeps the events already loaded and asks only for newer ones
+  const { data: gameEvents } = useQuery({
+    queryKey: ["game-events", gameId],
+    queryFn: async () => {
+      if (!token) return [];
+      
+      const events: any[] = [...(queryClient.getQueryData<any[]>(["game-events", gameId]) ?? [])];
+      let after = events.length > 0 ? events[events.length - 1].seq : 0;
+      let hasMore = true;
+      
+      while (hasMore) {
+        const response = await fetch(`http://localhost:5000/api/games/${gameId}/events?after=${after}&limit=200`, {
+          headers: {
+            Authorization: `Bearer ${token}`,
+          },
+        });
+        
+        if (!response.ok) {
+          const errorData = await response.json();
+          throw new Error(errorData.error || "Failed to fetch game events");
+        }
+        
+        const page = await response.json();
+        events.push(...page.events);
+        after = page.next_cursor;
+        hasMore = page.has_more;
+      }
+      
+      return events;
+    },
+    enabled: !!token && !!gameId,
+  });
+
   // Join game mutation
   const joinGameMutation = useMutation({
     mutationFn: async () => {
@@ -71,6 +105,7 @@ const PlayGame = () => {
     onSuccess: () => {
       toast.success("Successfully joined the game!");
       queryClient.invalidateQueries({ queryKey: ["game", gameId] });
+      queryClient.invalidateQueries({ queryKey: ["game-events", gameId] });
     },
     onError: (error: Error) => {
       toast.error(error.message);
@@ -100,6 +135,7 @@ const PlayGame = () => {
     onSuccess: () => {
       toast.success("Game started successfully!");
       queryClient.invalidateQueries({ queryKey: ["game", gameId] });
+      queryClient.invalidateQueries({ queryKey: ["game-events", gameId] });
     },
     onError: (error: Error) => {
       toast.error(error.message);
@@ -130,6 +166,7 @@ const PlayGame = () => {
     onSuccess: () => {
       toast.success("Move successful!");
       queryClient.invalidateQueries({ queryKey: ["game", gameId] });
+      queryClient.invalidateQueries({ queryKey: ["game-events", gameId] });
       setSelectedAction(null);
       setTargetLocation(null);
     },
@@ -451,16 +488,18 @@ const PlayGame = () => {
                   </CardHeader>
                   <CardContent>
                     <div className="h-64 overflow-y-auto pr-2 space-y-2">
-                      {game.data.events.length === 0 ? (
+                      {!gameEvents || gameEvents.length === 0 ? (
                         <p className="text-gray-400">No events yet</p>
                       ) : (
-                        game.data.events.map((event: any, index: number) => (
-                          <div key={index} className="border-b border-white/10 pb-2 last:border-0">
+                        gameEvents.map((event: any) => (
+                          <div key={event.seq} className="border-b border-white/10 pb-2 last:border-0">
                             <div className="text-sm text-gray-400">
                               {new Date(event.timestamp).toLocaleTimeString()}
                             </div>
                             <div className="text-sm">
+                              {event.type === 'player_joined' && `${event.player_name} joined the game`}
                               {event.type === 'game_start' && 'Game started by ' + event.description.split('by ')[1]}
+                              {event.type === 'player_moved' && `${event.player_name} moved to ${event.position}`}
                               {event.type === 'particle_collected' && `${event.player_name} collected a ${event.particle_type}`}
                               {event.type === 'quantum_gate_used' && `${event.player_name} used a quantum gate`}
                               {event.type === 'turn_ended' && `${event.player_name} ended their turn. ${event.next_player}'s turn now.`}
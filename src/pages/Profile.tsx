@@ -44,6 +44,15 @@ const Profile = () => {
   });
 
   const handleLogout = () => {
+    // Revoke the token on the server; the local session ends either way
+    if (token) {
+      fetch("http://localhost:5000/api/logout", {
+        method: "POST",
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      }).catch(() => {});
+    }
     localStorage.removeItem("token");
     localStorage.removeItem("user");
     toast.success("Logged out successfully");